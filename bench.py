@@ -0,0 +1,165 @@
+"""
+performance benchmarks, written as JSON
+    python bench.py [--output bench.json] [--baseline old_bench.json] [--quick]
+perft counts the lines of play from the starting position of several board
+sizes (move generation only), the solve benchmarks solve fixed positions
+with every combination of use_tt, use_killer and use_ordering (exact
+solves always use the tt, so only use_killer and use_ordering vary)
+every benchmark runs in a fresh process, so its peak memory is its own
+with --baseline, benchmarks whose nodes per second dropped by more than
+--tolerance are listed and the exit status is 1
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import resource
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+
+from oth_board import OthBoard
+from oth_player_ab import OthelloPlayerAB
+
+# (board size, depth) of every perft benchmark
+PERFT = [(4, 9), (6, 7), (8, 7)]
+
+# (name, board size, moves from the start, exact) of every solve benchmark
+# 4x4 and 5x5 are the positions of test_4x4.gtp and test_5x5.gtp, 6x6 is
+# solved exactly with 14 empty squares left
+SOLVES = [
+    ('4x4', 4, '', False),
+    ('5x5', 5, '', False),
+    ('6x6_14', 6, 'B3 B2 B1 B4 B5 D2 E5 A6 D1 E4 C5 A1 E3 C1 B6 F4 F3 D6', True)]
+
+# every solve benchmark is run with each of these
+CONFIGS = [dict(zip(['use_tt', 'use_killer', 'use_ordering'], values))
+           for values in itertools.product([False, True], repeat=3)]
+# and every exact one with each of these, SolveExact ignores use_tt
+EXACT_CONFIGS = [dict(zip(['use_killer', 'use_ordering'], values))
+                 for values in itertools.product([False, True], repeat=2)]
+
+SOLVE_TIME_LIMIT = 600
+
+def PeakMemory():
+    """
+    peak resident memory of this process in KB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def Result(name, nodes, wall_time, **info):
+    """
+    one benchmark's JSON record
+    """
+    result = {'name': name}
+    result.update(info)
+    result.update({
+        'nodes': nodes,
+        'wall_time': round(wall_time, 4),
+        'nodes_per_second': round(nodes / max(wall_time, 1e-9), 1),
+        'peak_memory_kb': PeakMemory()})
+    return result
+
+def RunPerft(size, depth):
+    """
+    perft from the starting position of a board of size <size * size>, in a worker
+    """
+    board = OthBoard(4)
+    board.ChangeSize(size)
+
+    start = time()
+    leaves = board.Perft(depth)
+    return Result('perft {0}x{0} depth {1}'.format(size, depth), leaves, time() - start,
+                  benchmark='perft', size=size, depth=depth)
+
+def RunSolve(name, size, moves, exact, config):
+    """
+    solve a fixed position with one configuration, in a worker
+    nodes are the searches of the solver and its endgame solver
+    """
+    board = OthBoard(4)
+    board.ChangeSize(size)
+    for move in moves.split():
+        board.Play(board.StrToMove(move))
+
+    player = OthelloPlayerAB(board)
+    player.SetTimeLimit(SOLVE_TIME_LIMIT)
+    for setting, value in config.items():
+        setattr(player, setting, value)
+
+    if exact:
+        result, _, wall_time = player.SolveExact()
+    else:
+        result, wall_time, _ = player.Solve()
+
+    flags = ' '.join('{}={}'.format(setting, int(value)) for setting, value in config.items())
+    return Result('solve {} {}'.format(name, flags), player.searches + player.endgame.nodes, wall_time,
+                  benchmark='solve_exact' if exact else 'solve', position=name, config=config,
+                  result=result, searches=player.searches, endgame_nodes=player.endgame.nodes)
+
+def RunAll(quick):
+    """
+    run every benchmark, one at a time and each in a new process
+    with quick, the slow 5x5 solve is left out
+    """
+    jobs = [(RunPerft, size, depth) for size, depth in PERFT]
+    for name, size, moves, exact in SOLVES:
+        if quick and name == '5x5':
+            continue
+        jobs += [(RunSolve, name, size, moves, exact, config)
+                 for config in (EXACT_CONFIGS if exact else CONFIGS)]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+        for job in jobs:
+            result = executor.submit(*job).result()
+            print('{}: {} nodes in {}s'.format(result['name'], result['nodes'], result['wall_time']),
+                  file=sys.stderr)
+            results.append(result)
+    return results
+
+def Regressions(results, baseline, tolerance):
+    """
+    list of (name, old, new nodes per second) of the results slower than
+    the baseline's by more than tolerance (a fraction)
+    """
+    old = {r['name']: r['nodes_per_second'] for r in baseline['results']}
+    slower = []
+    for r in results:
+        if r['name'] in old and r['nodes_per_second'] < (1 - tolerance) * old[r['name']]:
+            slower.append((r['name'], old[r['name']], r['nodes_per_second']))
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description="perft and solver benchmarks as JSON")
+    parser.add_argument('--output', help="file to write the JSON to (default: stdout)")
+    parser.add_argument('--baseline', help="earlier JSON output to compare nodes per second with")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="slowdown against the baseline that counts as a regression")
+    parser.add_argument('--quick', action='store_true', help="leave out the 5x5 solve")
+    args = parser.parse_args()
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': RunAll(args.quick)}
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        slower = Regressions(report['results'], baseline, args.tolerance)
+        for name, old, new in slower:
+            print('regression: {} {:.0f} -> {:.0f} nodes/s'.format(name, old, new), file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+if "__main__" == __name__:
+    main()
@@ -3,7 +3,10 @@ parses commands and executes them on a given board
 """
 
 import sys
-from oth_player_ab import WIN, LOSS, DRAW, ABORTED, MAXIMUM_DEPTH
+from time import time
+from oth_player_ab import WIN, LOSS, DRAW, ABORTED, MAXIMUM_DEPTH, ALPHA_BETA, DFPN
+from oth_board import PASS
+from oth_parallel import ParallelSolver, YBWCSolver
 
 SUCCEED = 1
 
@@ -15,6 +18,7 @@ class CommandEngine:
         """
         self.board = board
         self.engine = engine
+        self.parallel = None
 
         self.commands = {
             "commands": self._commands_cmd,
@@ -27,10 +31,24 @@ class CommandEngine:
             "showboard": self._show_board_cmd,
             "best_move": self._best_move,
             "solve": self._solve_cmd,
+            "solver": self._solver_cmd,
+            "solve_exact": self._solve_exact_cmd,
             "undo": self._undo_cmd,
+            "perft": self._perft_cmd,
             "use_killer": self._use_killer_cmd,
             "use_ordering": self._use_ordering_cmd,
+            "use_fastest_first": self._use_fastest_first_cmd,
+            "order_min_empties": self._order_min_empties_cmd,
             "use_tt": self._use_tt_cmd,
+            "use_stability": self._use_stability_cmd,
+            "endgame_empties": self._endgame_empties_cmd,
+            "tt_mb": self._tt_mb_cmd,
+            "use_symmetry": self._use_symmetry_cmd,
+            "db_attach": self._db_attach_cmd,
+            "db_flush": self._db_flush_cmd,
+            "db_stats": self._db_stats_cmd,
+            "load_weights": self._load_weights_cmd,
+            "workers": self._workers_cmd,
             "self_play": self._self_play
         }
 
@@ -44,6 +62,8 @@ class CommandEngine:
             print()
             line = sys.stdin.readline()
             if not line:
+                # write the database (if attached) to disk before exiting
+                self.engine.DetachDB()
                 break
 
             line = line.strip().split()
@@ -56,21 +76,28 @@ class CommandEngine:
     def _commands_cmd(self, args):
         print(' '.join(self.commands.keys()))
 
+    def _moves_str(self, moves):
+        """
+        string form of a list of moves, only used for output
+        """
+        return [self.board.MoveToStr(m) for m in moves]
+
     # Returns a best move for colour args from state
     def _best_move(self, args):
-        result = self.engine.BestMove()
-        print(result[1])
+        result = (self.parallel or self.engine).BestMove()
+        print(self.board.MoveToStr(result[1]))
         if result[0]:
             print('Search has hit maximum depth, no win or loss calculated')
-        print('Top move: {}'.format(result))
+        results = [[r, self.board.MoveToStr(m), p] for r, m, p in result[2]]
+        print('Top move: {}'.format([result[0], self.board.MoveToStr(result[1]), results]))
 
     def _self_play(self, args):
         while True:
             # Get a move:
-            move = self.engine.BestMove()
+            move = (self.parallel or self.engine).BestMove()
 
             # If there are no legal moves
-            if not move[1]:
+            if move[1] == PASS and self.board.Terminal():
                 winner, score = self.board.Winner()
                 print("Winner is {}, with score {}".format(winner, score))
                 return False
@@ -92,10 +119,20 @@ class CommandEngine:
         if not legal_moves:
             print('pass')
         else:
-            print(' '.join(legal_moves))
+            print(' '.join(self._moves_str(legal_moves)))
+
+    def _play_move_str(self, move_str):
+        """
+        play a move given as a string like "A1", return False if illegal
+        """
+        try:
+            move = self.board.StrToMove(move_str)
+        except ValueError:
+            return False
+        return self.board.Play(move)
 
     def _play_cmd(self, args):
-        if not self.board.Play(args[0]):
+        if not self._play_move_str(args[0]):
             print("Illegal Move")
 
     def _play_game_cmd(self, args):
@@ -113,18 +150,20 @@ class CommandEngine:
 
                     if len(self.board.GetLegalMoves()) == 0:
                         print("No legal moves")
+                        self.board.Play(PASS)
+                        break
                     else:
-                        print("Legal Moves: {}" .format(self.board.GetLegalMoves()))
+                        print("Legal Moves: {}" .format(self._moves_str(self.board.GetLegalMoves())))
                         player_move = input("What is your move? ")
                         # Play Move:
-                        if not self.board.Play(player_move):
+                        if not self._play_move_str(player_move):
                             print("Illegal Move")
                         else:
                             break
 
-                move = self.engine.BestMove()
+                move = (self.parallel or self.engine).BestMove()
 
-                if not move[1]:
+                if move[1] == PASS and self.board.Terminal():
                     winner, score = self.board.Winner()
                     print("Winner is {}, with score {}".format(winner, score))
                     return False
@@ -138,9 +177,9 @@ class CommandEngine:
         # player goes second.
         elif int(args[0]) == 2:
             while True:
-                move = self.engine.BestMove()
+                move = (self.parallel or self.engine).BestMove()
 
-                if not move[1]:
+                if move[1] == PASS and self.board.Terminal():
                     winner, score = self.board.Winner()
                     print("Winner is {}, with score {}".format(winner, score))
                     return False
@@ -153,15 +192,17 @@ class CommandEngine:
 
                 while True:
                     if len(self.board.GetLegalMoves()) != 0:
-                        print("Legal Moves: {}".format(self.board.GetLegalMoves()))
+                        print("Legal Moves: {}".format(self._moves_str(self.board.GetLegalMoves())))
                         player_move = input("What is your move? ")
                         # Play Move:
-                        if not self.board.Play(player_move):
+                        if not self._play_move_str(player_move):
                             print("Illegal Move")
                         else:
                             break
                     else:
                         print("No Legal Moves")
+                        self.board.Play(PASS)
+                        break
 
                 if self.board.Terminal():
                     winner, score = self.board.Winner()
@@ -174,17 +215,64 @@ class CommandEngine:
 
     def _set_size_cmd(self, args):
         size = int(args[0])
-        self.board.ChangeSize(size)
+        try:
+            self.board.ChangeSize(size)
+        except ValueError as e:
+            print(e)
 
     def _set_time_limit_cmd(self, args):
         tl = int(args[0])
         self.engine.SetTimeLimit(tl)
 
+    def _use_symmetry_cmd(self, args):
+        if args[0].strip().lower() == "true":
+            self.engine.use_symmetry = True
+        elif args[0].strip().lower() == "false":
+            self.engine.use_symmetry = False
+        else:
+            print('use_symmetry must be true or false')
+
+    def _db_attach_cmd(self, args):
+        try:
+            if len(args) > 1:
+                self.engine.AttachDB(args[0], float(args[1]))
+            else:
+                self.engine.AttachDB(args[0])
+        except (OSError, ValueError) as e:
+            print('could not attach database: {}'.format(e))
+
+    def _db_flush_cmd(self, args):
+        if self.engine.db is None:
+            print('no database attached')
+            return
+        self.engine.db.Flush()
+
+    def _db_stats_cmd(self, args):
+        if self.engine.db is None:
+            print('no database attached')
+            return
+        print(self.engine.db.Stats())
+
+    def _load_weights_cmd(self, args):
+        try:
+            evaluator = self.engine.LoadEvaluator(args[0])
+        except (OSError, ValueError) as e:
+            print('could not load weights: {}'.format(e))
+            return
+        print('loaded pattern weights for {0}x{0} boards'.format(evaluator.size))
+
+    def _tt_mb_cmd(self, args):
+        size_mb = float(args[0])
+        if size_mb <= 0:
+            print('tt_mb must be positive')
+            return
+        self.engine.SetTTSize(size_mb)
+
     def _show_board_cmd(self, args):
         print(self.board)
 
     def _solve_cmd(self, args):
-        result, _time, score = self.engine.Solve()
+        result, _time, score = (self.parallel or self.engine).Solve()
         if result == WIN:
             print('{} wins. Search took {}s'.format(self.board.CurrentPlayerStr(), _time))
         elif result == LOSS:
@@ -193,9 +281,53 @@ class CommandEngine:
             print('search aborted after {} seconds'.format(self.engine.time_limit))
         print(self.engine.GetStats())
 
+    def _solve_exact_cmd(self, args):
+        score, pv, _time = self.engine.SolveExact()
+        if score is None:
+            print('search aborted after {} seconds'.format(self.engine.time_limit))
+        else:
+            print('{} scores {}. Search took {}s'.format(self.board.CurrentPlayerStr(), score, _time))
+            print('pv: {}'.format(' '.join(self._moves_str(pv))))
+        print(self.engine.GetStats())
+
+    def _solver_cmd(self, args):
+        solver = args[0].strip().lower()
+        if solver in [ALPHA_BETA, DFPN]:
+            self.engine.solver = solver
+        else:
+            print('solver must be {} or {}'.format(ALPHA_BETA, DFPN))
+
+    def _workers_cmd(self, args):
+        workers = int(args[0])
+        split_depth = int(args[1]) if len(args) > 1 else 1
+        mode = args[2].strip().lower() if len(args) > 2 else "root"
+        if mode not in ["root", "ybwc"]:
+            print('parallel mode must be root or ybwc')
+            return
+        if mode == "root" and split_depth not in [1, 2]:
+            print('split depth must be 1 or 2')
+            return
+        if workers <= 1:
+            self.parallel = None
+        elif mode == "root":
+            self.parallel = ParallelSolver(self.engine, workers, split_depth)
+        else:
+            self.parallel = YBWCSolver(self.engine, workers, split_depth)
+
     def _undo_cmd(self, args):
         self.board.Undo()
 
+    def _perft_cmd(self, args):
+        depth = int(args[0])
+        if depth < 0:
+            print('perft depth must be 0 or more')
+            return
+        start = time()
+        leaves = self.board.Perft(depth)
+        _time = time() - start
+        print('perft {}: {} leaves in {:.3f}s ({:.0f} leaves/s)'.format(
+            depth, leaves, _time, leaves / max(_time, 1e-9)))
+
     def _use_killer_cmd(self, args):
         if args[0].strip().lower() == "true":
             self.engine.use_killer = True
@@ -212,6 +344,40 @@ class CommandEngine:
         else:
             print('use_ordering must be true or false')
 
+    def _use_fastest_first_cmd(self, args):
+        if args[0].strip().lower() == "true":
+            self.engine.use_fastest_first = True
+        elif args[0].strip().lower() == "false":
+            self.engine.use_fastest_first = False
+        else:
+            print('use_fastest_first must be true or false')
+
+    def _order_min_empties_cmd(self, args):
+        empties = int(args[0])
+        if empties < 0:
+            print('order_min_empties must be 0 (always order) or more')
+            return
+        self.engine.order_min_empties = empties
+        if 0 < self.engine.endgame_empties and 0 < empties <= self.engine.endgame_empties + 1:
+            print('note: positions with at most {} empty squares go to the endgame solver, '
+                  'so this only has an effect with endgame_empties below {}'.format(
+                      self.engine.endgame_empties, empties - 1))
+
+    def _endgame_empties_cmd(self, args):
+        empties = int(args[0])
+        if empties < 0:
+            print('endgame_empties must be 0 (off) or more')
+            return
+        self.engine.endgame_empties = empties
+
+    def _use_stability_cmd(self, args):
+        if args[0].strip().lower() == "true":
+            self.engine.use_stability = True
+        elif args[0].strip().lower() == "false":
+            self.engine.use_stability = False
+        else:
+            print('use_stability must be true or false')
+
     def _use_tt_cmd(self, args):
         if args[0].strip().lower() == "true":
             self.engine.use_tt = True
@@ -5,7 +5,7 @@ def _ab(self):
     """
     self.searches += 1
 
-    if len(self.board.move_history) > self.board.size ** 2 - 4:
+    if self.board.ply > self.board.size ** 2 - 4:
         raise RuntimeError("move history too long")
 
     if self.Abort():
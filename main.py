@@ -3,10 +3,16 @@ from oth_board import OthBoard
 from command_engine import CommandEngine
 from oth_player_ab import OthelloPlayerAB
 import cProfile
+import glob
+
+# pattern weight files written by train.py, loaded for their board size
+WEIGHT_FILES = 'weights_*.bin'
 
 def main():
     board = OthBoard(4)
     solver = OthelloPlayerAB(board)
+    for path in sorted(glob.glob(WEIGHT_FILES)):
+        solver.LoadEvaluator(path)
 
     cmd_engine = CommandEngine(board, solver)
     cmd_engine.run()
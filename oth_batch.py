@@ -0,0 +1,177 @@
+"""
+batched move generation and evaluation with numpy
+positions are rows of an (N, 2) uint64 array of (black discs, white discs)
+bitboards, using the same bit layout as OthBoard (bit size * x + y),
+so boards of up to 8x8 are supported
+"""
+
+import numpy as np
+
+from oth_board import ShiftTable, BLACK, WHITE
+
+# EvaluateState's bonus for every corner the player to move can take
+CORNER_WEIGHT = -300.0
+
+def CheckSize(size):
+    """
+    raises ValueError if a board of size <size * size> does not fit in 64 bits
+    """
+    if size * size > 64:
+        raise ValueError("batched boards are at most 8x8, not {}x{}".format(size, size))
+
+def ToBitboards(boards):
+    """
+    (N, 2) bitboard array of an (N, size, size) array of EMPTY/BLACK/WHITE,
+    where boards[k, x, y] is square (x, y) of position k
+    an (N, 2) array is returned as uint64 unchanged
+    """
+    boards = np.asarray(boards)
+    if boards.ndim == 2:
+        return boards.astype(np.uint64)
+
+    n, size, _ = boards.shape
+    CheckSize(size)
+    weights = np.left_shift(np.uint64(1), np.arange(size * size, dtype=np.uint64))
+    flat = boards.reshape(n, size * size)
+
+    bitboards = np.empty((n, 2), dtype=np.uint64)
+    bitboards[:, 0] = ((flat == BLACK) * weights).sum(axis=1, dtype=np.uint64)
+    bitboards[:, 1] = ((flat == WHITE) * weights).sum(axis=1, dtype=np.uint64)
+    return bitboards
+
+def FromBoards(boards):
+    """
+    (bitboards, players, size) of a list of OthBoards (of the same size),
+    so a single board can go through the batched functions as N=1
+    """
+    size = boards[0].size
+    CheckSize(size)
+    bitboards = np.array([[b.discs[BLACK], b.discs[WHITE]] for b in boards], dtype=np.uint64)
+    players = np.array([b.current_player for b in boards])
+    return bitboards, players, size
+
+def Sides(bitboards, players):
+    """
+    (player, opponent) disc masks of every position
+    players is the player to move, one per position or one for all
+    """
+    bitboards = ToBitboards(bitboards)
+    players = np.broadcast_to(np.asarray(players), bitboards.shape[:1])
+    black = players == BLACK
+    player = np.where(black, bitboards[:, 0], bitboards[:, 1])
+    opponent = np.where(black, bitboards[:, 1], bitboards[:, 0])
+    return player, opponent
+
+def Shifter(size):
+    """
+    returns (full, dirs) like ShiftTable, as uint64
+    dirs has one (shift, wrap, back_wrap, steps) entry per direction,
+    back_wrap masks a shift in the opposite direction
+    """
+    full, dirs = ShiftTable(size)
+    wraps = {shift: wrap for shift, wrap, _ in dirs}
+    return np.uint64(full), [(shift, np.uint64(wrap), np.uint64(wraps[-shift]), steps)
+                             for shift, wrap, steps in dirs]
+
+def Shift(masks, shift, wrap):
+    """
+    moves every bit of masks <shift> squares (a signed bit offset)
+    """
+    if shift > 0:
+        return (masks << np.uint64(shift)) & wrap
+    return (masks >> np.uint64(-shift)) & wrap
+
+def Bits(masks, size):
+    """
+    (N, size * size) array of 0/1, one column per square of the masks
+    """
+    squares = np.arange(size * size, dtype=np.uint64)
+    return ((masks[:, None] >> squares) & np.uint64(1)).astype(np.uint8)
+
+def LegalMoveMasks(bitboards, players, size):
+    """
+    bitmask of all legal moves of every position, like OthBoard.GetMovesMask
+    every direction is flood filled through the opponent's discs at once
+    """
+    CheckSize(size)
+    full, dirs = Shifter(size)
+    player, opponent = Sides(bitboards, players)
+
+    moves = np.zeros_like(player)
+    for shift, wrap, _, steps in dirs:
+        pro = opponent & wrap
+        gen = pro & Shift(player, shift, full)
+        for s in steps:
+            step = s if shift > 0 else -s
+            gen |= pro & Shift(gen, step, full)
+            pro &= Shift(pro, step, full)
+        moves |= Shift(gen, shift, wrap)
+
+    return moves & full & ~(player | opponent)
+
+def FlipCounts(bitboards, players, size):
+    """
+    (N, size * size) array of the number of discs each move flips,
+    0 for illegal moves
+    """
+    CheckSize(size)
+    full, dirs = Shifter(size)
+    player, opponent = Sides(bitboards, players)
+    empties = full & ~(player | opponent)
+
+    counts = np.zeros((len(player), size * size), dtype=np.int32)
+    for shift, _, back_wrap, _ in dirs:
+        # run: squares whose next k squares this way are all opponent's
+        # (bits are moved back onto the square the move is played on)
+        run = Shift(opponent, -shift, back_wrap)
+        closer = Shift(Shift(player, -shift, back_wrap), -shift, back_wrap)
+        for k in range(1, size - 1):
+            if not run.any():
+                break
+            captures = run & closer & empties
+            counts += k * Bits(captures, size)
+            run &= Shift(run, -shift, back_wrap)
+            closer = Shift(closer, -shift, back_wrap)
+
+    return counts
+
+def Mobility(moves, size):
+    """
+    number of legal moves of every position, from LegalMoveMasks
+    """
+    return Bits(moves, size).sum(axis=1, dtype=np.int32)
+
+def CornerAccess(moves, size):
+    """
+    number of corners the player to move can take, from LegalMoveMasks
+    """
+    last = size - 1
+    corners = 0
+    for x, y in [(0, 0), (0, last), (last, 0), (last, last)]:
+        corners |= 1 << (size * x + y)
+    return Mobility(moves & np.uint64(corners), size)
+
+def EvaluateStates(bitboards, players, size):
+    """
+    OthBoard.EvaluateState of every position (lower is better for the
+    player to move): minus the mobility, with a bonus per reachable corner
+    """
+    moves = LegalMoveMasks(bitboards, players, size)
+    return -Mobility(moves, size) + CORNER_WEIGHT * CornerAccess(moves, size)
+
+def Features(bitboards, players, size):
+    """
+    all batched features of every position, as a dict of arrays:
+    moves (legal move masks), flips (FlipCounts), mobility, corners
+    (CornerAccess) and evaluation (EvaluateStates)
+    """
+    moves = LegalMoveMasks(bitboards, players, size)
+    mobility = Mobility(moves, size)
+    corners = CornerAccess(moves, size)
+    return {
+        'moves': moves,
+        'flips': FlipCounts(bitboards, players, size),
+        'mobility': mobility,
+        'corners': corners,
+        'evaluation': -mobility + CORNER_WEIGHT * corners
+    }
@@ -4,17 +4,49 @@ includes logic for legal moves, and ability to undo moves
 (includes move history)
 """
 
+from random import Random
+import struct
+
 EMPTY = 0
 BLACK = 1
 WHITE = 2
 BORDER = 3
 
+# moves are flat square indices (size * x + y), PASS is the one non-square move
+PASS = -1
+
 DIRS = [(-1, -1), (-1, 0), (-1, 1), 
         (0, -1), (0, 1),
         (1, -1), (1, 0), (1, 1)]
 
 LETTERS = [chr(x) for x in range(ord('A'), ord('Z')+1)]
 
+# largest board size, columns are lettered and positions are written with
+# one byte for the size (see ToBytes)
+MAX_SIZE = 16
+
+# shift tables are the same for every board of a given size,
+# so build them once per size and share them
+_SHIFT_TABLES = {}
+_ZOBRIST_TABLES = {}
+_RAY_TABLES = {}
+_NEIGHBOUR_TABLES = {}
+_SYMMETRY_TABLES = {}
+_STABILITY_TABLES = {}
+
+NUM_SYMMETRIES = 8
+KEY_MASK = (1 << 64) - 1
+
+# undo stack entry: move, flips, frontier, player_moves, opponent_moves
+UNDO_FIELDS = 5
+
+# ToBytes header: board size, player to move, followed by the black and
+# white disc masks in PositionMaskBytes(size) little endian bytes each
+POSITION_HEADER = struct.Struct('=BB')
+
+# fixed seed so zobrist keys are the same in every process and every run
+ZOBRIST_SEED = 0x07E110
+
 SYMBOLS = {
     EMPTY: '.',
     BLACK: 'X',
@@ -31,28 +63,449 @@ def opp(color):
     else:
         assert(False)
 
+def ShiftTable(size):
+    """
+    returns (full, dirs) for a board of size <size * size>
+    full has a bit set for every square of the board
+    dirs has one (shift, wrap, steps) entry per direction in DIRS:
+        shift is the signed bit offset of one step in that direction
+        wrap masks out the squares a shift would wrap around onto
+        steps are the doubling shifts (kogge-stone) needed to fill
+        the longest possible run of discs in that direction
+    """
+    if size in _SHIFT_TABLES:
+        return _SHIFT_TABLES[size]
+
+    full = (1 << (size * size)) - 1
+
+    first_col = 0
+    last_col = 0
+    for x in range(size):
+        first_col |= 1 << (size * x)
+        last_col |= 1 << (size * x + size - 1)
+
+    dirs = []
+    for dx, dy in DIRS:
+        shift = dx * size + dy
+
+        wrap = full
+        if dy == 1:
+            wrap &= ~first_col
+        elif dy == -1:
+            wrap &= ~last_col
+
+        # a run of opponent discs is at most size - 2 long
+        steps = []
+        run = 1
+        while run < size - 2:
+            steps.append(abs(shift) * run)
+            run *= 2
+
+        dirs.append((shift, wrap, steps))
+
+    _SHIFT_TABLES[size] = (full, dirs)
+    return _SHIFT_TABLES[size]
+
+def ZobristTable(size):
+    """
+    returns (keys, flip_keys, side_key) for a board of size <size * size>
+    keys[color][i] is the 64 bit key of a <color> disc on flat index i
+    flip_keys[i] is keys[BLACK][i] ^ keys[WHITE][i], for flipping a disc
+    side_key is xored in when WHITE is to play
+    """
+    if size in _ZOBRIST_TABLES:
+        return _ZOBRIST_TABLES[size]
+
+    rng = Random(ZOBRIST_SEED * 100 + size)
+    n = size * size
+
+    keys = [[0] * n for _ in range(3)]
+    for color in [BLACK, WHITE]:
+        for i in range(n):
+            keys[color][i] = rng.getrandbits(64)
+
+    flip_keys = [keys[BLACK][i] ^ keys[WHITE][i] for i in range(n)]
+    side_key = rng.getrandbits(64)
+
+    _ZOBRIST_TABLES[size] = (keys, flip_keys, side_key)
+    return _ZOBRIST_TABLES[size]
+
+def SymmetryTable(size):
+    """
+    returns (perms, inverse, place_keys, flip_keys, side_key) for a board
+    of size <size * size>, covering the 8 rotations and reflections
+    perms[t][i] is the square that flat index i maps to under transform t,
+    and inverse[t] undoes perms[t].
+    the zobrist keys of all 8 transformed positions are packed 64 bits
+    each into one int (transform t in bits 64t..64t+63), so one xor
+    updates all of them:
+        place_keys[color][i] packs keys[color][perms[t][i]]
+        flip_keys[i] packs flip_keys[perms[t][i]]
+        side_key packs the side to move key 8 times
+    """
+    if size in _SYMMETRY_TABLES:
+        return _SYMMETRY_TABLES[size]
+
+    keys, flips, side = ZobristTable(size)
+    limit = size - 1
+    transforms = [
+        lambda x, y: (x, y),
+        lambda x, y: (limit - x, y),
+        lambda x, y: (x, limit - y),
+        lambda x, y: (limit - x, limit - y),
+        lambda x, y: (y, x),
+        lambda x, y: (limit - y, x),
+        lambda x, y: (y, limit - x),
+        lambda x, y: (limit - y, limit - x)]
+
+    n = size * size
+    perms = []
+    inverse = []
+    for transform in transforms:
+        perm = [0] * n
+        inv = [0] * n
+        for i in range(n):
+            x, y = transform(i // size, i % size)
+            perm[i] = size * x + y
+            inv[perm[i]] = i
+        perms.append(perm)
+        inverse.append(inv)
+
+    def pack(table, i):
+        packed = 0
+        for t in range(NUM_SYMMETRIES):
+            packed |= table[perms[t][i]] << (64 * t)
+        return packed
+
+    place_keys = [[0] * n for _ in range(3)]
+    for color in [BLACK, WHITE]:
+        place_keys[color] = [pack(keys[color], i) for i in range(n)]
+    flip_keys = [pack(flips, i) for i in range(n)]
+
+    side_key = 0
+    for t in range(NUM_SYMMETRIES):
+        side_key |= side << (64 * t)
+
+    _SYMMETRY_TABLES[size] = (perms, inverse, place_keys, flip_keys, side_key)
+    return _SYMMETRY_TABLES[size]
+
+def NeighbourTable(size):
+    """
+    returns neighbours for a board of size <size * size>
+    neighbours[i] is the bitmask of all squares adjacent to flat index i
+    """
+    if size in _NEIGHBOUR_TABLES:
+        return _NEIGHBOUR_TABLES[size]
+
+    _, dirs = ShiftTable(size)
+    neighbours = []
+    for i in range(size * size):
+        bit = 1 << i
+        mask = 0
+        for shift, wrap, _ in dirs:
+            if shift > 0:
+                mask |= (bit << shift) & wrap
+            else:
+                mask |= (bit >> -shift) & wrap
+        neighbours.append(mask)
+
+    _NEIGHBOUR_TABLES[size] = neighbours
+    return _NEIGHBOUR_TABLES[size]
+
+def StabilityTable(size):
+    """
+    returns orientations for a board of size <size * size>, one entry
+    (lines, sides) for each of the 4 line orientations (the pairs of
+    opposite directions in DIRS):
+        lines are the masks of all lines of the board in that orientation
+        sides has one (back, wrap, border) entry per direction of the pair,
+        (X << back) & wrap (>> for a negative back) marks the squares whose
+        neighbour that way is in X, border the squares without a neighbour
+    """
+    if size in _STABILITY_TABLES:
+        return _STABILITY_TABLES[size]
+
+    full, dirs = ShiftTable(size)
+    wraps = {shift: wrap for shift, wrap, _ in dirs}
+
+    orientations = []
+    for dx, dy in DIRS:
+        # each pair once, from its first direction in DIRS
+        if DIRS.index((-dx, -dy)) < DIRS.index((dx, dy)):
+            continue
+
+        lines = []
+        for i in range(size * size):
+            x, y = i // size, i % size
+            # lines start on the square without a neighbour behind it
+            if 0 <= x - dx < size and 0 <= y - dy < size:
+                continue
+            line = 0
+            while 0 <= x < size and 0 <= y < size:
+                line |= 1 << (size * x + y)
+                x += dx
+                y += dy
+            lines.append(line)
+
+        sides = []
+        for sx, sy in [(dx, dy), (-dx, -dy)]:
+            back = -(sx * size + sy)
+            border = 0
+            for i in range(size * size):
+                x, y = i // size + sx, i % size + sy
+                if not (0 <= x < size and 0 <= y < size):
+                    border |= 1 << i
+            sides.append((back, wraps[back], border))
+
+        orientations.append((lines, sides))
+
+    _STABILITY_TABLES[size] = orientations
+    return _STABILITY_TABLES[size]
+
+def MovesMask(player, opponent, targets, dirs):
+    """
+    returns bitmask of all legal moves for <player> given the two disc masks
+    every direction is flood filled through the opponent's discs at once
+    only empty squares in <targets> are considered (the frontier, or all empties)
+    """
+    moves = 0
+
+    for shift, wrap, steps in dirs:
+        pro = opponent & wrap
+        if shift > 0:
+            gen = pro & (player << shift)
+            for s in steps:
+                gen |= pro & (gen << s)
+                pro &= pro << s
+            moves |= (gen << shift) & wrap
+        else:
+            gen = pro & (player >> -shift)
+            for s in steps:
+                gen |= pro & (gen >> s)
+                pro &= pro >> s
+            moves |= (gen >> -shift) & wrap
+
+    return moves & targets
+
+def RayTable(size):
+    """
+    returns rays for a board of size <size * size>
+    rays[i] holds, for each direction in DIRS, the squares walking
+    away from flat index i as single bit masks, nearest first.
+    rays shorter than 2 squares can never capture and are left out
+    """
+    if size in _RAY_TABLES:
+        return _RAY_TABLES[size]
+
+    rays = []
+    for i in range(size * size):
+        x, y = i // size, i % size
+        square_rays = []
+        for dx, dy in DIRS:
+            ray = []
+            cx, cy = x + dx, y + dy
+            while 0 <= cx < size and 0 <= cy < size:
+                ray.append(1 << (size * cx + cy))
+                cx += dx
+                cy += dy
+            if len(ray) >= 2:
+                square_rays.append(ray)
+        rays.append(square_rays)
+
+    _RAY_TABLES[size] = rays
+    return _RAY_TABLES[size]
+
+def FlipsMask(square_rays, player, opponent):
+    """
+    returns bitmask of all discs flipped if <player> plays on the square
+    with rays <square_rays>, 0 if the move captures nothing
+    """
+    flips = 0
+
+    for ray in square_rays:
+        line = 0
+        for bit in ray:
+            if bit & opponent:
+                line |= bit
+            elif bit & player:
+                flips |= line
+                break
+            else:
+                break
+
+    return flips
+
+def BitsToIndices(mask):
+    """
+    returns flat indices of all set bits in mask, lowest first
+    """
+    indices = []
+    while mask:
+        low = mask & -mask
+        indices.append(low.bit_length() - 1)
+        mask ^= low
+    return indices
+
+def PositionMaskBytes(size):
+    """
+    bytes used for one disc mask of a board of size <size * size>
+    """
+    return (size * size + 7) // 8
+
+def PositionBytes(size):
+    """
+    length of OthBoard.ToBytes for a board of size <size * size>
+    """
+    return POSITION_HEADER.size + 2 * PositionMaskBytes(size)
+
+def BoardFromBytes(data):
+    """
+    new OthBoard set up at a position written by OthBoard.ToBytes
+    """
+    board = OthBoard(4)
+    board.FromBytes(data)
+    return board
+
 class OthBoard:
 
+    __slots__ = [
+        'allow_odd_size_boards', 'size', 'komi', 'track_symmetry', 'patterns',
+        'full', 'dirs', 'rays', 'neighbours', 'stability',
+        'zobrist', 'zobrist_flip', 'zobrist_side',
+        'discs', 'counts', 'empties', 'frontier', 'current_player',
+        'undo_stack', 'ply', 'player_moves', 'opponent_moves', 'key',
+        'sym_perms', 'sym_inverse', 'sym_place', 'sym_flip', 'sym_side', 'sym_key',
+        'pattern_terms', 'pattern_indices']
+
     def __init__(self, size):
         """
         create Othello Board of size <size * size>
-        max size of 10 for now
+        max size of MAX_SIZE
         """
-        assert(size > 0 and size < 10)
+        assert(size > 0 and size <= MAX_SIZE)
         # you should only be able to set odd size if you choose to
         assert(not size % 2)
 
         self.allow_odd_size_boards = True
         self.size = size
         self.komi = 0.5 # for simplification purposes for now
+        self.track_symmetry = False
+        # pattern evaluator whose indices are kept up to date, see TrackPatterns
+        self.patterns = None
         self.Reset()
 
+    def TrackSymmetry(self, track):
+        """
+        turn incremental keys for the 8 symmetric positions on or off
+        (needed for CanonicalKey)
+        """
+        if track == self.track_symmetry:
+            return
+
+        self.track_symmetry = track
+        if not track:
+            self.sym_key = None
+            return
+
+        self.sym_perms, self.sym_inverse, self.sym_place, self.sym_flip, self.sym_side = \
+            SymmetryTable(self.size)
+        self.sym_key = self.ComputeSymmetryKey()
+
+    def TrackPatterns(self, evaluator):
+        """
+        keep the pattern indices of evaluator (a PatternEvaluator for this
+        board size) up to date, or stop when evaluator is None
+        """
+        self.patterns = evaluator
+        if evaluator is None:
+            self.pattern_indices = None
+            return
+
+        if evaluator.size != self.size:
+            raise ValueError("pattern evaluator is for {}x{} boards".format(
+                evaluator.size, evaluator.size))
+        self.pattern_terms = evaluator.terms
+        self.pattern_indices = evaluator.Indices(self)
+
+    def EvaluatePatterns(self):
+        """
+        predicted final disc differential for the current player,
+        from the tracked pattern evaluator
+        """
+        return self.patterns.Evaluate(self.pattern_indices, self.current_player)
+
+    def UpdatePatterns(self, move, flips, player, sign):
+        """
+        update the pattern indices for player placing a disc on move and
+        flipping flips (sign 1), or for taking that back (sign -1)
+        """
+        indices = self.pattern_indices
+        terms = self.pattern_terms
+
+        # colors are the base 3 digits, so a change adds (new - old) * 3 ** k
+        placed = sign * player
+        for i, power in terms[move]:
+            indices[i] += placed * power
+
+        flipped = sign * (player - opp(player))
+        while flips:
+            low = flips & -flips
+            for i, power in terms[low.bit_length() - 1]:
+                indices[i] += flipped * power
+            flips ^= low
+
+    def ComputeSymmetryKey(self):
+        """
+        computes the packed keys of all 8 symmetric positions from scratch
+        """
+        sym_key = 0
+        for color in [BLACK, WHITE]:
+            for i in BitsToIndices(self.discs[color]):
+                sym_key ^= self.sym_place[color][i]
+        if self.current_player == WHITE:
+            sym_key ^= self.sym_side
+        return sym_key
+
+    def CanonicalKey(self):
+        """
+        returns (key, t): the smallest zobrist key among the 8 symmetric
+        positions, and the transform t taking this position to that one
+        """
+        sym_key = self.sym_key
+        best = sym_key & KEY_MASK
+        best_t = 0
+        for t in range(1, NUM_SYMMETRIES):
+            key = (sym_key >> (64 * t)) & KEY_MASK
+            if key < best:
+                best = key
+                best_t = t
+        return best, best_t
+
+    def TransformMove(self, move, t):
+        """
+        square move maps to under transform t
+        (negative moves and the identity transform 0 leave it unchanged)
+        """
+        if move < 0 or not t:
+            return move
+        return self.sym_perms[t][move]
+
+    def InverseTransformMove(self, move, t):
+        """
+        undoes TransformMove
+        """
+        if move < 0 or not t:
+            return move
+        return self.sym_inverse[t][move]
+
     def ChangeSize(self, size):
         """
         change size of board, and also reset it
         """
         if size % 2 and not self.allow_odd_size_boards:
             raise ValueError("size of Othello board must be even.")
+        if not 2 <= size <= MAX_SIZE:
+            raise ValueError("size of Othello board must be 2 to {}.".format(MAX_SIZE))
         
         self.size = size
         self.Reset()
@@ -61,11 +514,56 @@ class OthBoard:
         """
         reset to empty board, beginning of game
         """
-        n = self.size ** 2
-        self.board = [EMPTY] * n
-        self.move_history = []
+        self.full, self.dirs = ShiftTable(self.size)
+        self.rays = RayTable(self.size)
+        self.neighbours = NeighbourTable(self.size)
+        self.stability = StabilityTable(self.size)
+        self.zobrist, self.zobrist_flip, self.zobrist_side = ZobristTable(self.size)
+
+        # one disc mask per color, bit (size * x + y) is square (x, y)
+        # index EMPTY is unused
+        self.discs = [0, 0, 0]
+
+        # number of empty, black and white squares, indexed by color
+        self.counts = [self.size ** 2, 0, 0]
+        # empty squares, and the empty squares next to at least one disc
+        # (the only squares that can ever be legal moves)
+        self.empties = self.full
+        self.frontier = 0
+
+        # UNDO_FIELDS entries for every move played (PASS included), set in
+        # place so Play and Undo allocate no lists or tuples, it grows in
+        # blocks the first time a line of play gets that deep
+        self.undo_stack = []
+        self.ply = 0
         self.current_player = BLACK
 
+        # legal move masks of the player to move and the opponent in this
+        # position, None until generated, see GetMovesMask
+        self.player_moves = None
+        self.opponent_moves = None
+
+        # zobrist key of the position, kept up to date by Play, Undo and SetBoard
+        self.key = 0
+
+        # packed keys of all 8 symmetric positions, None unless tracked
+        if self.track_symmetry:
+            self.sym_perms, self.sym_inverse, self.sym_place, self.sym_flip, self.sym_side = \
+                SymmetryTable(self.size)
+            self.sym_key = 0
+        else:
+            self.sym_key = None
+
+        # base 3 index of every pattern instance, None unless tracked
+        # (an evaluator for another board size is dropped)
+        if self.patterns is not None and self.patterns.size != self.size:
+            self.patterns = None
+        if self.patterns is not None:
+            self.pattern_terms = self.patterns.terms
+            self.pattern_indices = [0] * len(self.patterns.instances)
+        else:
+            self.pattern_indices = None
+
         m2 = self.size // 2
         m1 = m2 - 1
 
@@ -74,6 +572,67 @@ class OthBoard:
         self.Place((m1, m2), BLACK)
         self.Place((m2, m1), BLACK)
 
+    def SetPosition(self, black, white, player):
+        """
+        set up the position with disc masks black and white and player to
+        move, without history
+        """
+        self.Reset()
+        for idc in BitsToIndices(self.full & ~(black | white) & ~self.empties):
+            self.SetBoard(idc // self.size, idc % self.size, EMPTY)
+        for color, mask in [(BLACK, black), (WHITE, white)]:
+            for idc in BitsToIndices(mask & ~self.discs[color]):
+                self.SetBoard(idc // self.size, idc % self.size, color)
+        if self.current_player != player:
+            self.SwitchPlayer()
+
+    def ToBytes(self):
+        """
+        the position (size, player to move and both disc masks) as
+        PositionBytes(size) bytes, the history is not included
+        """
+        n = PositionMaskBytes(self.size)
+        return (POSITION_HEADER.pack(self.size, self.current_player)
+                + self.discs[BLACK].to_bytes(n, 'little')
+                + self.discs[WHITE].to_bytes(n, 'little'))
+
+    def FromBytes(self, data):
+        """
+        set up the position written by ToBytes, changing size if needed
+        """
+        size, player = POSITION_HEADER.unpack_from(data)
+        if len(data) != PositionBytes(size):
+            raise ValueError("{} bytes is not a {}x{} position".format(len(data), size, size))
+
+        n = PositionMaskBytes(size)
+        start = POSITION_HEADER.size
+        black = int.from_bytes(data[start:start + n], 'little')
+        white = int.from_bytes(data[start + n:start + 2 * n], 'little')
+        if black & white or (black | white) >> (size * size) or player not in [BLACK, WHITE]:
+            raise ValueError("invalid {}x{} position".format(size, size))
+
+        if size != self.size:
+            self.ChangeSize(size)
+        self.SetPosition(black, white, player)
+
+    def Fork(self):
+        """
+        copy of the board's current position without its history, sharing
+        the per size tables (and pattern evaluator) with this board
+        """
+        board = OthBoard.__new__(OthBoard)
+        for name in OthBoard.__slots__:
+            if hasattr(self, name):
+                setattr(board, name, getattr(self, name))
+
+        board.discs = list(self.discs)
+        board.counts = list(self.counts)
+        if self.pattern_indices is not None:
+            board.pattern_indices = list(self.pattern_indices)
+        board.undo_stack = []
+        board.ply = 0
+        return board
+
     def __str__(self):
         """
           A B C D
@@ -90,15 +649,15 @@ class OthBoard:
             for j in range(size):
                 tmp_board[i][j] = self.AccessBoard(i, j)
 
-        lines = ['  ' + ' '.join(LETTERS[0:self.size])]
+        # row numbers are padded to the widest one
+        width = len(str(size))
+        lines = [' ' * width + ' ' + ' '.join(LETTERS[0:self.size])]
 
         # transpose the 2D array so it prints out correctly
         cpboard = [*zip(*tmp_board)]
 
         for i, row in enumerate(cpboard):
-            line = [str(i+1)]
-            if self.size > 9 and i < 9:
-                line[0] += ' '
+            line = [str(i+1).ljust(width)]
             line += [SYMBOLS[x] for x in row]
             lines.append(' '.join(line))
 
@@ -109,7 +668,7 @@ class OthBoard:
         """
         creates hash of the board quickly
         """
-        return hash(''.join([SYMBOLS[x] for x in self.board]) + str(self.current_player))
+        return self.key
 
     def PointToStr(self, move):
         """
@@ -119,10 +678,53 @@ class OthBoard:
 
     def StrToPoint(self, _str):
         """
-        for example: "A1" -> (0, 0)
+        for example: "A1" -> (0, 0), "J12" -> (9, 11)
+        raises ValueError if _str is not a letter followed by a number
         """
         _str = _str.upper()
-        return ord(_str[0]) - ord('A'), int(_str[1]) - 1
+        if len(_str) < 2 or not _str[0].isalpha() or not _str[1:].isdigit():
+            raise ValueError("{} is not a point".format(_str))
+        return ord(_str[0]) - ord('A'), int(_str[1:]) - 1
+
+    def PointToMove(self, p):
+        """
+        for example: (1, 2) -> 6 on a 4x4 board
+        """
+        return self.size * p[0] + p[1]
+
+    def MoveToPoint(self, move):
+        """
+        for example: 6 -> (1, 2) on a 4x4 board
+        """
+        return move // self.size, move % self.size
+
+    def MoveToStr(self, move):
+        """
+        for example: 0 -> "A1", PASS -> "pass"
+        """
+        if move == PASS:
+            return 'pass'
+        return self.PointToStr(self.MoveToPoint(move))
+
+    def StrToMove(self, _str):
+        """
+        for example: "A1" -> 0, "pass" -> PASS
+        raises ValueError if the point is not on the board
+        """
+        if _str.lower() == 'pass':
+            return PASS
+
+        x, y = self.StrToPoint(_str)
+        if not self.InBounds(x) or not self.InBounds(y):
+            raise ValueError("{} is not on the board".format(_str))
+        return self.PointToMove((x, y))
+
+    def Corners(self):
+        """
+        returns the four corner moves
+        """
+        limit = self.size - 1
+        return [self.PointToMove(c) for c in [(0, 0), (0, limit), (limit, 0), (limit, limit)]]
 
     def CurrentPlayer(self):
         """
@@ -157,120 +759,165 @@ class OthBoard:
                 points.append((x+dx, y+dy))
         return points
 
-    def isSafe(self, p, colour):
-        # Check if a corner is available
-        neighbours = self.AllPointsBeside(p)
+    def StableDiscs(self, colour):
+        """
+        bitmask of the discs of colour that can never be flipped again
+        a disc is stable if in each of the 4 line orientations its line is
+        full, or it has the edge of the board or a stable disc of its own
+        colour next to it. starting from the discs settled by edges and
+        full lines alone (corners first), stable discs are added until
+        nothing changes
+        """
+        own = self.discs[colour]
+        if not own:
+            return 0
+
+        occupied = self.full & ~self.empties
+        settled = []
+        for lines, sides in self.stability:
+            fixed = 0
+            for line in lines:
+                if line & occupied == line:
+                    fixed |= line
+            for _, _, border in sides:
+                fixed |= border
+            settled.append((fixed, sides))
+
+        stable = 0
+        while True:
+            new = own
+            for fixed, sides in settled:
+                ok = fixed
+                for back, wrap, _ in sides:
+                    if back > 0:
+                        ok |= (stable << back) & wrap
+                    else:
+                        ok |= (stable >> -back) & wrap
+                new &= ok
+                if not new:
+                    return 0
+
+            if new == stable:
+                return stable
+            stable = new
 
+    def isSafe(self, p, colour):
+        """
+        tells us if the disc of colour on point p (or a string like 'A1')
+        can never be flipped
+        """
         if isinstance(p, str):
             p = self.StrToPoint(p)
-
-        x, y = p
-
-        limit = self.size - 1
-        corners = [(0, 0), (0, limit), (limit, 0), (limit, limit)]
-
-        for corner in corners:
-            if self.AccessBoard(corner[0], corner[1]) == colour:
-                pass
-
-        for n in neighbours:
-            if self.AccessBoard(x, y) == colour:
-                self.isSafe(n, colour)
+        return bool(self.StableDiscs(colour) & (1 << self.PointToMove(p)))
 
     def AccessBoard(self, x, y):
         """
         returns the color of the board at point x, y
         """
-        sz = self.size
-        idc = sz * x + y
-        return self.board[idc]
+        bit = 1 << (self.size * x + y)
+        if self.discs[BLACK] & bit:
+            return BLACK
+        if self.discs[WHITE] & bit:
+            return WHITE
+        return EMPTY
 
     def SetBoard(self, x, y, color):
         """
         sets the color of the board at point x, y
         """
-        sz = self.size
-        idc = sz * x + y
-        self.board[idc] = color
+        idc = self.size * x + y
+        old = self.AccessBoard(x, y)
+        if old != EMPTY:
+            self.key ^= self.zobrist[old][idc]
+        if color != EMPTY:
+            self.key ^= self.zobrist[color][idc]
+
+        if self.sym_key is not None:
+            if old != EMPTY:
+                self.sym_key ^= self.sym_place[old][idc]
+            if color != EMPTY:
+                self.sym_key ^= self.sym_place[color][idc]
+
+        if self.pattern_indices is not None:
+            for i, power in self.pattern_terms[idc]:
+                self.pattern_indices[i] += (color - old) * power
+
+        self.counts[old] -= 1
+        self.counts[color] += 1
+
+        self.player_moves = None
+        self.opponent_moves = None
+
+        bit = 1 << idc
+        self.discs[BLACK] &= ~bit
+        self.discs[WHITE] &= ~bit
+        if color != EMPTY:
+            self.discs[color] |= bit
+            self.empties &= ~bit
+            self.frontier = (self.frontier & ~bit) | (self.neighbours[idc] & self.empties)
+        else:
+            self.empties |= bit
+            self.frontier = self.ComputeFrontier()
 
-    def GetCaptures(self, move):
+    def ComputeFrontier(self):
         """
-        returns all points captured by this move
+        computes the frontier from scratch (empty squares next to a disc)
         """
-        our_color = self.CurrentPlayer()
-
-        x, y = move
-
-        if not self.InBounds(x) or not self.InBounds(y):
-            return []
-
-        if self.AccessBoard(x, y) != EMPTY:
-            return []
-
-        all_captures = []
-
-        legal = False
-        # check in all 8 directions (othello works diagonally)
-        for dx, dy in DIRS:
-            cx, cy = move
-            cx, cy = cx + dx, cy + dy
-
-            seen_opp = False
-            tmp_captures = []
-
-            # cx tracks where we are checking
-            while self.InBounds(cx) and self.InBounds(cy):
-
-                if self.AccessBoard(cx, cy) == opp(our_color):
-                    tmp_captures.append((cx, cy))
-                    seen_opp = True
-
-                elif self.AccessBoard(cx, cy) == EMPTY:
-                    # illegal line of captures
-                    tmp_captures = []
-                    break
+        frontier = 0
+        occupied = self.full & ~self.empties
+        for idc in BitsToIndices(self.empties):
+            if self.neighbours[idc] & occupied:
+                frontier |= 1 << idc
+        return frontier
+
+    def GetFlips(self, move):
+        """
+        returns bitmask of all discs captured by this move
+        """
+        if not self.frontier & (1 << move):
+            return 0
 
-                elif self.AccessBoard(cx, cy) == our_color and seen_opp:
-                    # legal line of capture
-                    all_captures += tmp_captures
-                    tmp_captures = []
-                    break
+        player = self.discs[self.current_player]
+        opponent = self.discs[opp(self.current_player)]
+        return FlipsMask(self.rays[move], player, opponent)
 
-                cx += dx
-                cy += dy
-
-        return all_captures
+    def GetCaptures(self, move):
+        """
+        returns all squares captured by this move
+        """
+        return BitsToIndices(self.GetFlips(move))
 
     def NumCaptured(self, move):
         """
         :param move: the move of a player
         :return: returns an int of the number of pieces captured by a move
         """
-        if isinstance(move, str):
-            move = self.StrToPoint(move)
+        return self.GetFlips(move).bit_count()
 
-        return len(self.GetCaptures(move))
+    def MobilityAfter(self, move):
+        """
+        number of legal moves the opponent has after the current player
+        plays move, from the flips of move without playing it
+        """
+        flips = self.GetFlips(move)
+        bit = 1 << move
+        player = self.discs[self.current_player] | flips | bit
+        opponent = self.discs[opp(self.current_player)] ^ flips
+        frontier = (self.frontier ^ bit) | (self.neighbours[move] & self.empties & ~bit)
+        return MovesMask(opponent, player, frontier, self.dirs).bit_count()
 
     def EvaluateMove(self, move):
         """
-        :param move: The move taken by the agent (needs to be (x, y) tuple form)
+        :param move: The move taken by the agent (a square index)
         :return: retuns a tuple of two floats based on the desirability of the current state and move
         """
-        move = self.StrToPoint(move)
-
         self.Play(move)
         legal_moves = self.GetLegalMoves()
-        player_count = 0
-        opponent_count = 0
         move_score = 0.0
-        move_length = float(len(self.move_history))
+        move_length = float(self.ply)
 
-        for i in range(self.size):
-            for j in range(self.size):
-                if self.AccessBoard(i, j) == self.current_player:
-                    player_count += 1
-                elif self.AccessBoard(i, j) != 0:
-                    opponent_count += 1
+        player_count = self.counts[self.current_player]
+        opponent_count = self.counts[opp(self.current_player)]
 
         # Move Score update on Mobility
         if move_length != 0:
@@ -286,9 +933,7 @@ class OthBoard:
         move_score += (float(captured) + difference)
 
         # Check if move creates corner state --> better (checked at all times)
-        limit = self.size - 1
-        corners = [(0, 0), (0, limit), (limit, 0), (limit, limit)]
-        adjacent_corners = [(1, 1), (1, limit-1), (limit-1, 1), (limit-1, limit-1)]
+        corners = self.Corners()
 
         # Check if the current move is a corner play, or if the current state can allow for a corner play
         # Update both values
@@ -310,8 +955,7 @@ class OthBoard:
         stateScore = -(len(legalMoves))
 
         # Check if a corner is available
-        limit = self.size - 1
-        corners = [(0, 0), (0, limit), (limit, 0), (limit, limit)]
+        corners = self.Corners()
 
         # Check if the current move is a corner play, or if the current state can allow for a corner play
         # Update both values
@@ -325,32 +969,48 @@ class OthBoard:
         """
         tells us if move is legal
         """
-        if self.GetCaptures(move):
+        if self.GetFlips(move):
             return True
         return False
 
-    def Play(self, p):
+    def Play(self, move):
         """
-        play at point p 
+        play at square move, or PASS when the current player has no move
         """
+        if move == PASS:
+            if self.GetMovesMask() or self.Terminal():
+                return False
+            self.PushUndo(PASS, 0)
+            self.SwitchPlayer()
+            return True
 
-        if isinstance(p, str):
-            if p.lower() == 'pass':
-                raise RuntimeError("passing during AB search, incorrect")
-                self.current_player = opp(self.current_player)
-                return True
-            p = self.StrToPoint(p)
-        
-        captures = self.GetCaptures(p)
-        if not captures:
+        flips = self.GetFlips(move)
+        if not flips:
             return False
-        
-        self.SetBoard(p[0], p[1], self.current_player)
-        for x, y in captures:
-            self.SetBoard(x, y, self.current_player)
+
+        bit = 1 << move
+        self.discs[self.current_player] |= flips | bit
+        self.discs[opp(self.current_player)] ^= flips
+
+        self.key ^= self.zobrist[self.current_player][move] ^ self.zobrist_side
+        self.FlipKey(flips)
+        if self.sym_key is not None:
+            self.FlipSymmetryKey(move, flips)
+        if self.pattern_indices is not None:
+            self.UpdatePatterns(move, flips, self.current_player, 1)
+
+        n = flips.bit_count()
+        self.counts[self.current_player] += n + 1
+        self.counts[opp(self.current_player)] -= n
+        self.counts[EMPTY] -= 1
+
+        self.PushUndo(move, flips)
+        self.player_moves = None
+        self.opponent_moves = None
+        self.empties ^= bit
+        self.frontier = (self.frontier ^ bit) | (self.neighbours[move] & self.empties)
 
         self.current_player = opp(self.current_player)
-        self.move_history.append((p, captures))
 
         return True
 
@@ -359,41 +1019,140 @@ class OthBoard:
         undo last move on the stack, and uncapture all captured pieces
         set captured to current player
         """
-        p, captures = self.move_history.pop()
-        x, y = p
-        self.SetBoard(x, y, EMPTY)
-        for x, y in captures:
-            self.SetBoard(x, y, self.CurrentPlayer())
+        if not self.ply:
+            raise IndexError("no move to undo")
+        self.ply -= 1
+        i = UNDO_FIELDS * self.ply
+        stack = self.undo_stack
+        move = stack[i]
+        if move == PASS:
+            self.SwitchPlayer()
+            return
+
+        flips = stack[i + 1]
+        frontier = stack[i + 2]
+        self.player_moves = stack[i + 3]
+        self.opponent_moves = stack[i + 4]
+        bit = 1 << move
         self.current_player = opp(self.current_player)
+        self.discs[self.current_player] ^= flips | bit
+        self.discs[opp(self.current_player)] |= flips
+
+        self.key ^= self.zobrist[self.current_player][move] ^ self.zobrist_side
+        self.FlipKey(flips)
+        if self.sym_key is not None:
+            self.FlipSymmetryKey(move, flips)
+        if self.pattern_indices is not None:
+            self.UpdatePatterns(move, flips, self.current_player, -1)
+
+        n = flips.bit_count()
+        self.counts[self.current_player] -= n + 1
+        self.counts[opp(self.current_player)] += n
+        self.counts[EMPTY] += 1
+
+        self.empties |= bit
+        self.frontier = frontier
+
+    def PushUndo(self, move, flips):
+        """
+        store what Undo needs to take back move on the undo stack
+        """
+        i = UNDO_FIELDS * self.ply
+        stack = self.undo_stack
+        if i == len(stack):
+            stack.extend([0] * (UNDO_FIELDS * self.size))
+        stack[i] = move
+        stack[i + 1] = flips
+        stack[i + 2] = self.frontier
+        stack[i + 3] = self.player_moves
+        stack[i + 4] = self.opponent_moves
+        self.ply += 1
+
+    def Perft(self, depth):
+        """
+        number of lines of play <depth> moves deep from this position,
+        a pass counts as a move and a finished game as one line
+        """
+        if depth == 0:
+            return 1
+
+        moves = self.GetMovesMask()
+        if not moves:
+            if self.Terminal():
+                return 1
+            self.Play(PASS)
+            leaves = self.Perft(depth - 1)
+            self.Undo()
+            return leaves
+
+        # the moves themselves are the lines of the last ply
+        if depth == 1:
+            return moves.bit_count()
+
+        leaves = 0
+        while moves:
+            low = moves & -moves
+            self.Play(low.bit_length() - 1)
+            leaves += self.Perft(depth - 1)
+            self.Undo()
+            moves ^= low
+        return leaves
+
+    def SwitchPlayer(self):
+        """
+        hand the move to the other player without playing (a pass),
+        calling it again undoes it
+        Play(PASS) does the same but keeps it in the move history
+        """
+        self.current_player = opp(self.current_player)
+        self.player_moves, self.opponent_moves = self.opponent_moves, self.player_moves
+        self.key ^= self.zobrist_side
+        if self.sym_key is not None:
+            self.sym_key ^= self.sym_side
+
+    def FlipKey(self, flips):
+        """
+        update the zobrist key for every disc in flips changing color
+        """
+        flip_keys = self.zobrist_flip
+        while flips:
+            low = flips & -flips
+            self.key ^= flip_keys[low.bit_length() - 1]
+            flips ^= low
+
+    def FlipSymmetryKey(self, move, flips):
+        """
+        update the packed symmetric keys for the disc placed (or removed)
+        on move by the current player and every disc in flips
+        """
+        sym_flip = self.sym_flip
+        sym_key = self.sym_key ^ self.sym_place[self.current_player][move] ^ self.sym_side
+        while flips:
+            low = flips & -flips
+            sym_key ^= sym_flip[low.bit_length() - 1]
+            flips ^= low
+        self.sym_key = sym_key
 
     def Terminal(self):
         """
         return True if the game is over for the current state
         False otherwise
         """
-        if self.GetLegalMoves():
+        if self.GetMovesMask():
             return False
 
-        self.current_player = opp(self.current_player)
-        if self.GetLegalMoves():
-            self.current_player = opp(self.current_player)
-            return False
-        
-        self.current_player = opp(self.current_player)
-        return True
+        if self.opponent_moves is None:
+            player = self.discs[self.current_player]
+            opponent = self.discs[opp(self.current_player)]
+            self.opponent_moves = MovesMask(opponent, player, self.frontier, self.dirs)
+        return not self.opponent_moves
 
     def Winner(self):
         """
         return Winner, Score of the game
         """
-        bcount = 0
-        wcount = 0
-        for i in range(self.size):
-            for j in range(self.size):
-                if self.AccessBoard(i, j) == BLACK:
-                    bcount += 1
-                elif self.AccessBoard(i, j) == WHITE:
-                    wcount += 1
+        bcount = self.counts[BLACK]
+        wcount = self.counts[WHITE]
 
         score = bcount - wcount + self.komi # komi to make sure we don't tie for now
         if score > 0:
@@ -407,8 +1166,9 @@ class OthBoard:
     def Hash(self):
         """
         return hash of the board's state (not including history)
+        this is the 64 bit zobrist key, the same in every process
         """
-        return hash(self)
+        return self.key
 
     def Place(self, point, color):
         """
@@ -419,10 +1179,19 @@ class OthBoard:
         r, c = point
         self.SetBoard(r, c, color)
 
+    def GetMovesMask(self):
+        """
+        bitmask of all legal moves for the current player, generated once
+        per position
+        """
+        if self.player_moves is None:
+            player = self.discs[self.current_player]
+            opponent = self.discs[opp(self.current_player)]
+            self.player_moves = MovesMask(player, opponent, self.frontier, self.dirs)
+        return self.player_moves
+
     def GetLegalMoves(self):
-        moves = []
-        for i in range(self.size):
-            for j in range(self.size):
-                if self.IsLegal((i, j)):
-                    moves.append((i, j))
-        return [self.PointToStr(m) for m in moves]
+        """
+        list of all legal moves (square indices) for the current player
+        """
+        return BitsToIndices(self.GetMovesMask())
@@ -0,0 +1,157 @@
+"""
+persistent database of solved Othello positions
+a fixed record file opened with mmap, records are read in place so
+attaching a database does not load or deserialise anything
+"""
+
+import mmap
+import os
+import struct
+
+from oth_tt import NO_MOVE, Buckets, Signed16
+
+MAGIC = b'OTHDB001'
+
+# magic, number of buckets, number of records used (rest of the header is padding)
+HEADER = struct.Struct('=8sQQ')
+HEADER_BYTES = 64
+
+# a record is two native 64 bit words: zobrist key, packed data
+# (a key of 0 marks an empty record)
+RECORD_BYTES = 16
+BUCKET_SIZE = 4
+
+def PackData(lower, upper, move, weight):
+    """
+    packs three signed 16 bit values and an unsigned 16 bit weight into one word
+    """
+    return ((lower & 0xFFFF)
+            | (upper & 0xFFFF) << 16
+            | (move & 0xFFFF) << 32
+            | (weight & 0xFFFF) << 48)
+
+class SolvedDB:
+
+    def __init__(self, path, size_mb=64):
+        """
+        open the database at <path>, creating a <size_mb> megabyte one if
+        it does not exist yet (the size of an existing file is kept)
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+        if not os.path.exists(path):
+            buckets = Buckets(int(size_mb * 1024 * 1024) // RECORD_BYTES, BUCKET_SIZE)
+
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, buckets, 0).ljust(HEADER_BYTES, b'\0'))
+                f.truncate(HEADER_BYTES + buckets * BUCKET_SIZE * RECORD_BYTES)
+
+        self.words = None
+        self.file = open(path, 'r+b')
+        if os.fstat(self.file.fileno()).st_size < HEADER_BYTES:
+            self.file.close()
+            raise ValueError("{} is not a solved position database".format(path))
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+
+        magic, buckets, used = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.Close()
+            raise ValueError("{} is not a solved position database".format(path))
+
+        self.mask = buckets - 1
+        self.capacity = buckets * BUCKET_SIZE
+        self.used = used
+        self.words = memoryview(self.mm)[HEADER_BYTES:].cast('Q')
+
+    def Close(self):
+        """
+        flush and close the database
+        """
+        if self.mm is None:
+            return
+        if self.words is not None:
+            self.Flush()
+            self.words.release()
+            self.words = None
+        self.mm.close()
+        self.file.close()
+        self.mm = None
+
+    def Flush(self):
+        """
+        write all stored records to disk
+        """
+        HEADER.pack_into(self.mm, 0, MAGIC, self.mask + 1, self.used)
+        self.mm.flush()
+
+    def Probe(self, key):
+        """
+        returns (lower, upper, move) stored for key, None if not stored
+        """
+        words = self.words
+        base = (key & self.mask) * BUCKET_SIZE
+        for i in range(base, base + BUCKET_SIZE):
+            if words[2 * i] == key:
+                self.hits += 1
+                data = words[2 * i + 1]
+                return Signed16(data), Signed16(data >> 16), Signed16(data >> 32)
+        self.misses += 1
+        return None
+
+    def Store(self, key, lower, upper, move, nodes):
+        """
+        store bounds for key, tightening the bounds already stored for it
+        (and keeping its move if move is NO_MOVE)
+        a full bucket drops its record with the smallest proof (by node count)
+        the header's record count is kept current, so it is right even if
+        the database is never closed
+        """
+        words = self.words
+        base = (key & self.mask) * BUCKET_SIZE
+        weight = min(nodes.bit_length(), 0xFFFF)
+
+        slot = -1
+        slot_weight = 0
+        for i in range(base, base + BUCKET_SIZE):
+            k = words[2 * i]
+            if k == key:
+                data = words[2 * i + 1]
+                lower = max(lower, Signed16(data))
+                upper = min(upper, Signed16(data >> 16))
+                if move == NO_MOVE:
+                    move = Signed16(data >> 32)
+                weight = max(weight, data >> 48)
+                slot = i
+                break
+
+            if k == 0:
+                slot = i
+                self.used += 1
+                HEADER.pack_into(self.mm, 0, MAGIC, self.mask + 1, self.used)
+                break
+
+            w = words[2 * i + 1] >> 48
+            if slot == -1 or w < slot_weight:
+                slot = i
+                slot_weight = w
+        else:
+            # every record in the bucket is worth more than this one
+            if slot_weight > weight:
+                return
+
+        words[2 * slot] = key
+        words[2 * slot + 1] = PackData(lower, upper, move, weight)
+        self.writes += 1
+
+    def Stats(self):
+        return {
+            'path': self.path,
+            'capacity': self.capacity,
+            'used': self.used,
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes
+        }
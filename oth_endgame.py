@@ -0,0 +1,168 @@
+"""
+exact solver for the last few empty squares of a game
+works on the two disc masks alone (no OthBoard moves, no tt), keeping the
+empty squares in a linked list and trying moves in quadrants with an odd
+number of empties first, the last two empties are special cased
+"""
+
+from oth_board import EMPTY, RayTable, NeighbourTable, FlipsMask, BitsToIndices, opp
+
+class EndgameSolver:
+
+    def __init__(self, size):
+        """
+        solver for boards of size <size * size>
+        """
+        self.size = size
+        self.rays = RayTable(size)
+        self.neighbours = NeighbourTable(size)
+        self.nodes = 0
+
+        n = size * size
+        # quadrant bit of every square, for parity ordering
+        self.quadrant = [1 << (2 * (2 * (i // size) >= size) + (2 * (i % size) >= size))
+                         for i in range(n)]
+
+        # squares in the order they are tried within a parity class:
+        # corners first, the squares next to corners last
+        last = size - 1
+        corners = [size * x + y for x in [0, last] for y in [0, last]]
+        beside = set()
+        for c in corners:
+            beside.update(BitsToIndices(self.neighbours[c]))
+        self.order = (corners
+                      + [i for i in range(n) if i not in corners and i not in beside]
+                      + [i for i in sorted(beside) if i not in corners])
+
+        # linked list of empty squares, square n is the head
+        self.head = n
+        self.next = [n] * (n + 1)
+        self.prev = [n] * (n + 1)
+
+    def Solve(self, board, alpha, beta):
+        """
+        final disc differential for board's player to move, fail soft
+        within (alpha, beta)
+        """
+        empties = board.empties
+        player = board.discs[board.current_player]
+        opponent = board.discs[opp(board.current_player)]
+
+        nxt = self.next
+        prv = self.prev
+        last = self.head
+        parity = 0
+        for sq in self.order:
+            if empties & (1 << sq):
+                nxt[last] = sq
+                prv[sq] = last
+                last = sq
+                parity ^= self.quadrant[sq]
+        nxt[last] = self.head
+        prv[self.head] = last
+
+        return self.Search(player, opponent, alpha, beta, board.counts[EMPTY], parity, False)
+
+    def Search(self, player, opponent, alpha, beta, empties, parity, passed):
+        """
+        negamax alpha beta over the empty squares, passed is True when the
+        opponent just passed
+        """
+        if empties == 2:
+            a = self.next[self.head]
+            return self.LastTwo(player, opponent, a, self.next[a], alpha, beta)
+        if empties == 1:
+            return self.LastOne(player, opponent, self.next[self.head])
+
+        self.nodes += 1
+        nxt = self.next
+        prv = self.prev
+        rays = self.rays
+        neighbours = self.neighbours
+        quadrant = self.quadrant
+
+        best = -empties - self.size * self.size - 1
+        moved = False
+        # odd quadrants first, then even ones
+        for odd in [True, False]:
+            sq = nxt[self.head]
+            while sq != self.head:
+                if bool(parity & quadrant[sq]) == odd and neighbours[sq] & opponent:
+                    flips = FlipsMask(rays[sq], player, opponent)
+                    if flips:
+                        moved = True
+                        nxt[prv[sq]] = nxt[sq]
+                        prv[nxt[sq]] = prv[sq]
+
+                        score = -self.Search(opponent ^ flips, player | flips | (1 << sq),
+                                             -beta, -alpha, empties - 1, parity ^ quadrant[sq], False)
+
+                        nxt[prv[sq]] = sq
+                        prv[nxt[sq]] = sq
+
+                        if score > best:
+                            best = score
+                            if score > alpha:
+                                alpha = score
+                                if alpha >= beta:
+                                    return best
+                sq = nxt[sq]
+
+        if moved:
+            return best
+
+        if passed:
+            # nobody can move, the empty squares stay empty
+            return player.bit_count() - opponent.bit_count()
+        return -self.Search(opponent, player, -beta, -alpha, empties, parity, True)
+
+    def LastTwo(self, player, opponent, a, b, alpha, beta):
+        """
+        score with empty squares a and b left, playing each without a board
+        """
+        self.nodes += 1
+        rays = self.rays
+
+        best = None
+        for sq, other in [(a, b), (b, a)]:
+            flips = FlipsMask(rays[sq], player, opponent)
+            if flips:
+                score = -self.LastOne(opponent ^ flips, player | flips | (1 << sq), other)
+                if best is None or score > best:
+                    best = score
+                    if best >= beta:
+                        return best
+        if best is not None:
+            return best
+
+        # we pass, the opponent plays one of the two (or the game is over)
+        for sq, other in [(a, b), (b, a)]:
+            flips = FlipsMask(rays[sq], opponent, player)
+            if flips:
+                score = self.LastOne(player ^ flips, opponent | flips | (1 << sq), other)
+                if best is None or score < best:
+                    best = score
+                    if best <= alpha:
+                        return best
+        if best is not None:
+            return best
+
+        return player.bit_count() - opponent.bit_count()
+
+    def LastOne(self, player, opponent, sq):
+        """
+        score with only square sq empty, counting the flips of whoever can
+        play it (us first) instead of playing it
+        """
+        self.nodes += 1
+        diff = player.bit_count() - opponent.bit_count()
+
+        flips = FlipsMask(self.rays[sq], player, opponent)
+        if flips:
+            return diff + 2 * flips.bit_count() + 1
+
+        flips = FlipsMask(self.rays[sq], opponent, player)
+        if flips:
+            return diff - 2 * flips.bit_count() - 1
+
+        return diff
@@ -0,0 +1,532 @@
+"""
+parallel solving for OthelloPlayerAB
+ParallelSolver splits the root's moves (or the first two plies) into
+independent jobs, each solved in its own process with its own board copy,
+and searches the root moves of every BestMove iteration the same way
+YBWCSolver searches the eldest move of a node before handing its younger
+brothers to the workers, which share one transposition table
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from time import time
+
+from oth_board import BoardFromBytes, EMPTY, PASS, opp
+from oth_player_ab import OthelloPlayerAB, WIN, LOSS, ABORTED, Nega
+from oth_tt import TranspositionTable, SharedTranspositionTable, NO_MOVE
+
+# settings copied from the main player to the players in the workers
+SETTINGS = ['use_tt', 'tt_mb', 'use_symmetry', 'use_ordering', 'use_fastest_first', 'order_min_empties',
+            'use_killer', 'use_stability', 'endgame_empties', 'solver']
+
+# counters summed over all jobs (and the endgame solver's nodes)
+COUNTERS = ['searches', 'terminals', 'beta_cuts', 'stability_cuts', 'tt_hits', 'tt_misses',
+            'db_hits', 'db_writes']
+
+# cancel flags of the pool this worker belongs to, set by _InitWorker
+_cancel_flags = None
+# transposition table shared by the pool, None if jobs use their own
+_shared_tt = None
+# pattern evaluator of BestMove jobs, None to order moves by EvaluateMove
+_evaluator = None
+
+def _InitWorker(cancel_flags, tt_name=None, evaluator=None):
+    """
+    runs once in every worker process
+    """
+    global _cancel_flags, _shared_tt, _evaluator
+    _cancel_flags = cancel_flags
+    if tt_name is not None:
+        _shared_tt = SharedTranspositionTable(name=tt_name)
+    _evaluator = evaluator
+
+def _SolveJob(position, moves, group, settings, deadline):
+    """
+    solve the position after playing moves from position (OthBoard.ToBytes),
+    in a worker
+    returns (result, stats) for the player to move after the moves
+    """
+    start = time()
+    board = BoardFromBytes(position)
+    if _shared_tt is not None:
+        player = OthelloPlayerAB(board, _shared_tt)
+    else:
+        player = OthelloPlayerAB(board, TranspositionTable(settings['tt_mb']))
+    for name, value in settings.items():
+        setattr(player, name, value)
+
+    if _shared_tt is not None:
+        # marking the table as built for this size keeps StartSearch
+        # from clearing it under the other workers
+        player.tt_size = board.size
+        player.CreateMoveOrdering()
+        player.CreateKiller()
+
+    player.SetTimeLimit(max(0.0, deadline - time()))
+    player.cancel_flags = _cancel_flags
+    player.cancel_index = group
+
+    for m in moves:
+        player.MakeMove(m)
+
+    result, _, _ = player.Solve()
+    stats = {name: getattr(player, name) for name in COUNTERS}
+    stats['endgame_nodes'] = player.endgame.nodes
+    stats['time'] = time() - start
+    return result, stats
+
+def _DepthJob(position, first_move, max_depth, deadline):
+    """
+    one BestMove iteration of first_move from position (OthBoard.ToBytes),
+    in a worker
+    returns (result, first_state_value, max_reached, aborted, searches, terminals)
+    """
+    board = BoardFromBytes(position)
+    # the depth limited search does not use the tt
+    player = OthelloPlayerAB(board, TranspositionTable(0))
+    if _evaluator is not None:
+        player.evaluators[_evaluator.size] = _evaluator
+    player.PrepareBestMove()
+
+    player.start = time()
+    player.search_time = deadline - player.start
+    player.cancel_flags = _cancel_flags
+    player.searches = 0
+    player.terminals = 0
+
+    result = player.SearchFirstMove(first_move, max_depth)
+    value = player.first_state_values[(first_move, board.current_player)]
+    return result, value, player.max_reached, player.aborted, player.searches, player.terminals
+
+def _AddStats(player, stats):
+    """
+    add the statistics of a job (see _SolveJob) to player's
+    """
+    for name in COUNTERS:
+        setattr(player, name, getattr(player, name) + stats[name])
+    player.endgame.nodes += stats['endgame_nodes']
+
+class ParallelSolver:
+
+    def __init__(self, player, workers=None, split_depth=1):
+        """
+        solves player's board with <workers> processes (all cores by default),
+        splitting the first <split_depth> plies (1 or 2) into jobs
+        """
+        self.player = player
+        self.workers = workers or multiprocessing.cpu_count()
+        self.split_depth = split_depth
+
+    def Jobs(self):
+        """
+        returns list of (moves, group, side to move after moves)
+        group numbers the root move a job belongs to, starting at 1
+        """
+        board = self.player.board
+        jobs = []
+
+        for group, m in enumerate(board.GetLegalMoves() or [PASS], 1):
+            self.player.MakeMove(m)
+            replies = []
+            if self.split_depth > 1 and not board.Terminal():
+                replies = board.GetLegalMoves() or [PASS]
+
+            if not replies:
+                jobs.append(([m], group, board.current_player))
+
+            for r in replies:
+                self.player.MakeMove(r)
+                jobs.append(([m, r], group, board.current_player))
+                self.player.UnmakeMove(r)
+
+            self.player.UnmakeMove(m)
+
+        return jobs
+
+    def Solve(self):
+        """
+        solves board's current position for the current player
+        the first root move proven a WIN cancels all remaining jobs, and a
+        reply proven to refute a root move cancels that move's other jobs
+        returns following (like OthelloPlayerAB.Solve):
+        result, time_taken, score
+        """
+        player = self.player
+        board = player.board
+        player.StartSearch()
+
+        if board.Terminal():
+            return player.Solve()
+
+        root_player = board.current_player
+        jobs = self.Jobs()
+        groups = len(set(job[1] for job in jobs))
+
+        # jobs left per root move, WIN for us once it reaches 0
+        pending = {}
+        for _, group, _ in jobs:
+            pending[group] = pending.get(group, 0) + 1
+
+        settings = {name: getattr(player, name) for name in SETTINGS}
+        deadline = player.start + player.time_limit
+        position = board.ToBytes()
+
+        cancel_flags = multiprocessing.RawArray('b', groups + 1)
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_InitWorker,
+                                       initargs=(cancel_flags,))
+
+        futures = {}
+        result = None
+        lost = set()
+        finished = 0
+        cancelled = 0
+
+        try:
+            for moves, group, side in jobs:
+                future = executor.submit(_SolveJob, position, moves, group, settings, deadline)
+                futures[future] = (group, side)
+
+            pending_futures = set(futures)
+
+            while pending_futures and result is None:
+                done, pending_futures = wait(pending_futures, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    group, side = futures[future]
+                    if future.cancelled() or group in lost:
+                        continue
+
+                    job_result, stats = future.result()
+                    _AddStats(player, stats)
+                    finished += 1
+
+                    if job_result == ABORTED:
+                        continue
+
+                    # result for us (the player at the root) of the job's line
+                    if side != root_player:
+                        job_result = Nega(job_result)
+
+                    if job_result == LOSS:
+                        # the opponent has a good reply, this root move loses
+                        lost.add(group)
+                        cancel_flags[group] = 1
+                        for f in pending_futures:
+                            if futures[f][0] == group and not f.cancelled() and f.cancel():
+                                cancelled += 1
+
+                        if len(lost) == groups:
+                            result = LOSS
+                        continue
+
+                    pending[group] -= 1
+                    if pending[group] == 0:
+                        result = WIN
+                        break
+        finally:
+            cancel_flags[0] = 1
+            for f in futures:
+                if not f.done() and f.cancel():
+                    cancelled += 1
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        player.time_taken = time() - player.start
+        player.parallel_stats = {
+            'workers': self.workers,
+            'split_depth': self.split_depth,
+            'jobs': len(jobs),
+            'jobs_finished': finished,
+            'jobs_cancelled': cancelled
+        }
+
+        if result is None:
+            player.aborted = True
+            return ABORTED, -1, -1
+
+        _, score = board.Winner()
+        return result, player.time_taken, score
+
+    def BestMove(self):
+        """
+        picks a move like OthelloPlayerAB.BestMove, the root moves of every
+        iteration are searched by the workers
+        """
+        return _ParallelBestMove(self.player, self.workers)
+
+def _ParallelBestMove(player, workers):
+    """
+    OthelloPlayerAB.BestMove of player with each root move of an iteration
+    searched in its own job, by a pool of <workers> processes
+    the first move the opponent is proven to lose after cancels the iteration
+    """
+    board = player.board
+    first_moves = board.GetLegalMoves()
+    corners = board.Corners()
+    if len(first_moves) < 2 or any(m in corners for m in first_moves):
+        return player.BestMove()
+
+    player.PrepareBestMove()
+    solving_for = board.current_player
+    opponent = opp(solving_for)
+    results = []
+
+    player.start = time()
+    player.search_time = player.MoveTime()
+    player.aborted = False
+    deadline = player.start + player.search_time
+    position = board.ToBytes()
+
+    # cheap ordering until the first iteration finishes
+    first_moves = player.OrderMovesNega(first_moves)
+    best_move = first_moves[0]
+    max_reached = True
+    depth = 1
+
+    cancel_flags = multiprocessing.RawArray('b', 1)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_InitWorker,
+                                   initargs=(cancel_flags, None, player.evaluators.get(board.size)))
+    try:
+        while max_reached and depth <= board.counts[EMPTY]:
+            futures = {executor.submit(_DepthJob, position, m, depth, deadline): m for m in first_moves}
+            player.max_reached = False
+            iteration = {}
+
+            for future in as_completed(futures):
+                first_move = futures[future]
+                result, value, job_max_reached, aborted, searches, terminals = future.result()
+                player.searches += searches
+                player.terminals += terminals
+                player.first_state_values[(first_move, solving_for)] = value
+                player.max_reached = player.max_reached or job_max_reached
+                iteration[first_move] = [result, first_move, opponent]
+
+                if aborted:
+                    player.aborted = True
+                    break
+
+                # the opponent loses after this move, no need to look further
+                if result == LOSS:
+                    return [False, first_move, [iteration[m] for m in first_moves if m in iteration]]
+
+            # keep the last finished iteration on timeout
+            if player.aborted:
+                break
+
+            results = [iteration[m] for m in first_moves]
+            max_reached = player.max_reached
+
+            # moves the opponent wins after are only picked if all moves lose
+            not_losing = [r[1] for r in results if r[0] != WIN] or first_moves
+            best_move = max(not_losing, key=lambda m: player.first_state_values[(m, solving_for)])
+
+            # search the best move first next iteration
+            first_moves.remove(best_move)
+            first_moves.insert(0, best_move)
+            depth += 1
+    finally:
+        cancel_flags[0] = 1
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    return [max_reached, best_move, results]
+
+class YBWCSolver:
+
+    def __init__(self, player, workers=None, split_depth=2):
+        """
+        solves player's board with <workers> processes (all cores by default)
+        young brothers wait: at the first <split_depth> plies the eldest
+        move is searched first (by us), the younger brothers are only
+        searched if it does not cut off, in parallel by the workers
+        """
+        self.player = player
+        self.workers = workers or multiprocessing.cpu_count()
+        self.split_depth = split_depth
+
+        # shared table, kept between searches like the player's own tt
+        self.tt = None
+        self.tt_size = -1
+
+    def Solve(self):
+        """
+        solves board's current position for the current player
+        returns following (like OthelloPlayerAB.Solve):
+        result, time_taken, score
+        """
+        player = self.player
+        board = player.board
+
+        if self.tt is None or self.tt.size_mb != player.tt_mb:
+            if self.tt is not None:
+                self.tt.Close()
+            self.tt = SharedTranspositionTable(player.tt_mb)
+            self.tt_size = -1
+
+        # StartSearch clears the table in use when the board size changed
+        own_tt = player.tt
+        if player.tt_size != board.size:
+            own_tt.Clear()
+        elif self.tt_size != board.size:
+            self.tt.Clear()
+        self.tt_size = board.size
+
+        player.tt = self.tt
+        player.StartSearch()
+
+        self.settings = {name: getattr(player, name) for name in SETTINGS}
+        self.deadline = player.start + player.time_limit
+        # flag 1 stops the younger brothers currently searched
+        self.cancel_flags = multiprocessing.RawArray('b', 2)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_InitWorker,
+                                            initargs=(self.cancel_flags, self.tt.name))
+        self.jobs = 0
+        self.jobs_cancelled = 0
+        self.cutoffs = 0
+        self.cutoff_wait = 0.0
+        self.busy_time = 0.0
+
+        try:
+            result = self.Search(0)
+        finally:
+            self.cancel_flags[0] = 1
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            player.tt = own_tt
+
+        player.time_taken = time() - player.start
+        player.parallel_stats = {
+            'workers': self.workers,
+            'split_depth': self.split_depth,
+            'jobs': self.jobs,
+            'jobs_cancelled': self.jobs_cancelled,
+            'cutoffs': self.cutoffs,
+            'cutoff_wait': round(self.cutoff_wait, 4),
+            'busy_time': round(self.busy_time, 4),
+            # share of the workers' time spent searching, 1 is perfect scaling
+            # (not counting the extra nodes searched in parallel)
+            'efficiency': round(self.busy_time / max(player.time_taken * self.workers, 1e-9), 4),
+            'shared_tt_used': self.tt.used
+        }
+
+        if player.aborted:
+            return ABORTED, -1, -1
+
+        _, score = board.Winner()
+        return result, player.time_taken, score
+
+    def BestMove(self):
+        """
+        picks a move like ParallelSolver.BestMove (the depth limited search
+        has no cutoffs for young brothers wait to save)
+        """
+        return _ParallelBestMove(self.player, self.workers)
+
+    def Search(self, ply):
+        """
+        negamaxBoolean of the current position, splitting the younger
+        brothers of nodes less than split_depth plies from the root
+        """
+        player = self.player
+        board = player.board
+
+        if ply >= self.split_depth or board.Terminal():
+            start = time()
+            result = player.negamaxBoolean()
+            self.busy_time += time() - start
+            return result
+
+        player.searches += 1
+        if player.Abort():
+            player.aborted = True
+            return LOSS
+
+        searches = player.searches
+
+        tt_res = player.TTread()
+        if tt_res is not None:
+            return tt_res
+
+        db_res = player.DBread()
+        if db_res is not None:
+            return db_res
+
+        moves = player.SearchMoves()
+
+        player.MakeMove(moves[0])
+        result = Nega(self.Search(ply + 1))
+        player.UnmakeMove(moves[0])
+        move = moves[0]
+
+        if player.aborted:
+            return LOSS
+
+        if result != WIN and len(moves) > 1:
+            result, move = self.Brothers(moves[1:])
+            if player.aborted:
+                return LOSS
+
+        if result == WIN:
+            player.beta_cuts += 1
+            if player.use_killer and move != PASS:
+                player.UpdateKiller(move)
+            player.TTwrite(WIN, move, player.searches - searches)
+        else:
+            player.TTwrite(LOSS, NO_MOVE, player.searches - searches)
+        return result
+
+    def Brothers(self, moves):
+        """
+        searches the younger brothers in parallel, stopping them all as
+        soon as one of them wins for us
+        returns (result, winning move)
+        """
+        player = self.player
+        position = player.board.ToBytes()
+        self.cancel_flags[1] = 0
+
+        futures = {}
+        for m in moves:
+            future = self.executor.submit(_SolveJob, position, [m], 1, self.settings, self.deadline)
+            futures[future] = m
+        self.jobs += len(futures)
+
+        result = LOSS
+        move = NO_MOVE
+        pending = set(futures)
+
+        while pending and move == NO_MOVE and not player.aborted:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                job_result = self.JobResult(future)
+
+                if job_result == ABORTED:
+                    # out of time, the only other reason to stop
+                    player.aborted = True
+                elif Nega(job_result) == WIN and move == NO_MOVE:
+                    result = WIN
+                    move = futures[future]
+
+        if pending:
+            # cutoff (or timeout): stop the brothers still searching
+            if move != NO_MOVE:
+                self.cutoffs += 1
+            self.cancel_flags[1] = 1
+            start = time()
+            for future in pending:
+                if future.cancel():
+                    self.jobs_cancelled += 1
+            done, _ = wait(pending)
+            for future in done:
+                if not future.cancelled():
+                    self.JobResult(future)
+            self.cutoff_wait += time() - start
+
+        return result, move
+
+    def JobResult(self, future):
+        """
+        result of a finished job, adding its statistics to the player's
+        """
+        job_result, stats = future.result()
+        _AddStats(self.player, stats)
+        self.busy_time += stats['time']
+        return job_result
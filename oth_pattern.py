@@ -0,0 +1,158 @@
+"""
+pattern based evaluation of Othello positions
+the board is covered by patterns (edges, 3x3 and 2x5 corners, diagonals),
+every pattern instance reads its squares as a base 3 number (EMPTY 0,
+BLACK 1, WHITE 2) indexing a weight table shared by all instances of its
+pattern. OthBoard keeps the indices up to date as discs are placed and
+flipped, so an evaluation is one table lookup per instance
+"""
+
+from array import array
+import struct
+
+from oth_board import WHITE, SymmetryTable
+
+MAGIC = b'OTHPAT01'
+
+# magic, board size, number of patterns, then per pattern its number of
+# squares followed by its 3 ** squares float32 weights, and the bias
+HEADER = struct.Struct('=8sHH')
+LENGTH = struct.Struct('=H')
+BIAS = struct.Struct('=f')
+
+# longer patterns (edges of big boards) only use the squares nearest a corner
+MAX_PATTERN_SQUARES = 10
+
+_PATTERN_TABLES = {}
+
+def PatternShapes(size):
+    """
+    returns list of (name, squares) of the patterns of a board of size
+    <size * size>, squares as (x, y) next to the (0, 0) corner
+    """
+    n = min(size, MAX_PATTERN_SQUARES)
+    shapes = [
+        ('edge', [(0, y) for y in range(n)]),
+        ('corner3x3', [(x, y) for x in range(min(3, size)) for y in range(min(3, size))]),
+        ('corner2x5', [(x, y) for x in range(2) for y in range(min(5, size))])]
+
+    # the main diagonal and the shorter ones running parallel to it
+    for length in range(size, 3, -1):
+        offset = size - length
+        shapes.append(('diagonal{}'.format(length),
+                       [(i, i + offset) for i in range(min(length, MAX_PATTERN_SQUARES))]))
+
+    return shapes
+
+def PatternTable(size):
+    """
+    returns (patterns, instances, terms) for a board of size <size * size>
+    patterns[p] is (name, number of squares) of pattern p
+    instances[i] is (p, squares) for every placement of a pattern on the
+    board (the rotations and reflections of its shape, without duplicates)
+    terms[sq] lists (i, 3 ** k) for every instance i having square sq as
+    its k-th square
+    """
+    if size in _PATTERN_TABLES:
+        return _PATTERN_TABLES[size]
+
+    perms = SymmetryTable(size)[0]
+
+    patterns = []
+    instances = []
+    for name, shape in PatternShapes(size):
+        seen = set()
+        for perm in perms:
+            squares = [perm[size * x + y] for x, y in shape]
+            if frozenset(squares) in seen:
+                continue
+            seen.add(frozenset(squares))
+            instances.append((len(patterns), squares))
+        patterns.append((name, len(shape)))
+
+    terms = [[] for _ in range(size * size)]
+    for i, (_, squares) in enumerate(instances):
+        for k, sq in enumerate(squares):
+            terms[sq].append((i, 3 ** k))
+
+    _PATTERN_TABLES[size] = (patterns, instances, terms)
+    return _PATTERN_TABLES[size]
+
+class PatternEvaluator:
+
+    def __init__(self, size):
+        """
+        evaluator for boards of size <size * size> with all weights 0
+        """
+        self.size = size
+        self.patterns, self.instances, self.terms = PatternTable(size)
+        self.weights = [array('f', bytes(4 * 3 ** length)) for _, length in self.patterns]
+        self.bias = 0.0
+
+        # pattern (weight table) of every instance
+        self.instance_pattern = [p for p, _ in self.instances]
+
+    def Indices(self, board):
+        """
+        base 3 index of every pattern instance of board, from scratch
+        """
+        indices = []
+        for _, squares in self.instances:
+            index = 0
+            for sq in reversed(squares):
+                x, y = board.MoveToPoint(sq)
+                index = 3 * index + board.AccessBoard(x, y)
+            indices.append(index)
+        return indices
+
+    def Evaluate(self, indices, player):
+        """
+        predicted final disc differential for player, given the indices
+        of every pattern instance (the weights are for BLACK)
+        """
+        weights = self.weights
+        score = self.bias
+        for p, index in zip(self.instance_pattern, indices):
+            score += weights[p][index]
+
+        if player == WHITE:
+            return -score
+        return score
+
+    def Save(self, path):
+        """
+        write the weights to a weight file
+        """
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.size, len(self.patterns)))
+            for (_, length), weights in zip(self.patterns, self.weights):
+                f.write(LENGTH.pack(length))
+                weights.tofile(f)
+            f.write(BIAS.pack(self.bias))
+
+def LoadWeights(path):
+    """
+    returns a PatternEvaluator with the weights of a weight file
+    """
+    with open(path, 'rb') as f:
+        magic, size, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("{} is not a pattern weight file".format(path))
+
+        evaluator = PatternEvaluator(size)
+        if count != len(evaluator.patterns):
+            raise ValueError("{} has {} patterns, expected {}".format(
+                path, count, len(evaluator.patterns)))
+
+        for p, (_, length) in enumerate(evaluator.patterns):
+            stored, = LENGTH.unpack(f.read(LENGTH.size))
+            if stored != length:
+                raise ValueError("{}: pattern {} has {} squares, expected {}".format(
+                    path, p, stored, length))
+            weights = array('f')
+            weights.fromfile(f, 3 ** length)
+            evaluator.weights[p] = weights
+
+        evaluator.bias, = BIAS.unpack(f.read(BIAS.size))
+
+    return evaluator
@@ -2,10 +2,13 @@
 negamax alpha beta Othello player
 """
 
-from oth_board import EMPTY, BLACK, WHITE
+from oth_board import EMPTY, BLACK, WHITE, PASS, BitsToIndices, opp
+from oth_tt import TranspositionTable, ProofNumberTable, SCORE_MIN, SCORE_MAX, NO_MOVE
+from oth_db import SolvedDB
+from oth_pattern import LoadWeights
+from oth_endgame import EndgameSolver
 from time import time
-from random import randint
-from collections import defaultdict
+from math import floor
 
 WIN = 'win'
 LOSS = 'lose'
@@ -15,17 +18,41 @@ ABORTED = 'aborted'
 
 INF = 1e9
 
+# solvers Solve can use
+ALPHA_BETA = 'ab'
+DFPN = 'dfpn'
+
+# proof/disproof number of a proven node
+PN_INF = 10 ** 9
+
+# killer moves are tried before any history ordered move
+KILLER_BONUS = 1 << 40
+# the history is halved when an entry reaches this
+HISTORY_MAX = 1 << 30
+
+# fastest first ordering: a move's opponent mobility plus these weights
+# for corners and the squares diagonally next to them (in opponent moves)
+FASTEST_CORNER_WEIGHT = -4
+FASTEST_X_WEIGHT = 2
+
+# BestMove spends this many times an even share of the time limit
+# over our remaining moves on a single move (capped at the time limit)
+MOVE_TIME_SHARE = 2.0
+
 class OthelloPlayerAB:
 
-    def __init__(self, board):
+    def __init__(self, board, tt=None):
         """
-        creates solver for the current board
+        creates solver for the current board, using transposition table
+        <tt> (a new 16 MB table by default)
         """
         self.super_debug = False
 
         self.board = board
         self.time_limit = 60 # 1 minute time limit by default
         self.start = -INF
+        # time the running search may take, time_limit for Solve
+        self.search_time = self.time_limit
 
         self.searches = 0
         self.terminals = 0
@@ -36,18 +63,68 @@ class OthelloPlayerAB:
 
         # transposition table
         self.use_tt = False
+        if tt is None:
+            tt = TranspositionTable(16)
+        self.tt = tt
+        self.tt_mb = tt.size_mb
+        # board size the tt and ordering tables were built for
         self.tt_size = -1
-        self.tt = {}
-        self.tt_size = 100000 # make it this big for now
+        self.aborted = False
 
-        # move ordering
-        self.use_ordering = True
-        self._ordering = {}
+        # look up symmetric positions (rotations/reflections) as one tt entry
+        self.use_symmetry = False
+
+        # prune positions whose stable discs already decide the search
+        self.use_stability = True
+
+        # positions with at most this many empty squares are handed to the
+        # endgame solver (0 turns it off), see oth_endgame
+        self.endgame_empties = 6
+        self.endgame = None
 
-        # killer heuristic
-        # TODO SET TO FALSE
+        # pattern evaluators used by BestMove, per board size
+        self.evaluators = {}
+
+        # persistent solved position database, proven nodes with a subtree
+        # of at least db_min_nodes searches are written to it
+        self.db = None
+        self.db_min_nodes = 1000
+
+        # move ordering, weight per square
+        self.use_ordering = True
+        self._ordering = []
+
+        # fastest first: order by the opponent's mobility after each move,
+        # see OrderFastestFirst (used instead of the square weights)
+        self.use_fastest_first = False
+        self._fastest = []
+        # positions with fewer empty squares than this are searched in
+        # generation order (the tt move still goes first)
+        # only matters when it is above endgame_empties + 1 (positions with at
+        # most endgame_empties empties never reach SortMoves), so with the
+        # default settings just when the endgame solver is off
+        self.order_min_empties = 5
+
+        # history heuristic and killer moves, see CreateKiller
         self.use_killer = False
-        self._killer = {}
+        self._history = []
+        self._killers = []
+
+        # solver used by Solve, ALPHA_BETA (negamaxBoolean) or DFPN
+        self.solver = ALPHA_BETA
+        # df-pn keeps (pn, dn) per position in a ProofNumberTable of at most
+        # this many entries, made by the first df-pn search
+        self.pn_table_limit = 1000000
+        self.pn_table = None
+        self.root_pn = 1
+        self.root_dn = 1
+
+        # shared flags set by another process to stop this search
+        # (flag 0 stops everything, cancel_index stops just our job)
+        self.cancel_flags = None
+        self.cancel_index = 0
+        # extra statistics of the last parallel solve, see oth_parallel
+        self.parallel_stats = {}
 
     def SetTimeLimit(self, time_limit):
         """
@@ -55,40 +132,89 @@ class OthelloPlayerAB:
         """
         self.time_limit = time_limit
 
+    def AttachDB(self, path, size_mb=64):
+        """
+        attach the solved position database at path (created if missing)
+        the database attached before is only detached once path is open
+        """
+        db = SolvedDB(path, size_mb)
+        self.DetachDB()
+        self.db = db
+
+    def DetachDB(self):
+        """
+        flush and close the attached database, if any
+        """
+        if self.db is not None:
+            self.db.Close()
+            self.db = None
+
+    def LoadEvaluator(self, path):
+        """
+        load a pattern weight file, used by BestMove on boards of its size
+        """
+        evaluator = LoadWeights(path)
+        self.evaluators[evaluator.size] = evaluator
+        return evaluator
+
+    def SetTTSize(self, size_mb):
+        """
+        set capacity of the transposition table in megabytes (clears it)
+        """
+        self.tt_mb = size_mb
+        self.tt.Resize(size_mb)
+
     def GetStats(self):
-        return {
+        stats = {
             'searches': self.searches,
             'searches_per_second': round(self.searches / self.time_taken, 4),
             'terminals': self.terminals,
             'beta_cuts': self.beta_cuts,
+            'stability_cuts': self.stability_cuts,
+            'endgame_nodes': self.endgame.nodes if self.endgame is not None else 0,
             'tt_hits': self.tt_hits,
             'tt_misses': self.tt_misses,
-            'tt_gcs': self.tt_gcs
+            'tt_used': self.tt.used,
+            'tt_overwrites': self.tt.overwrites,
+            'db_hits': self.db_hits,
+            'db_writes': self.db_writes,
+            'solver': self.solver,
+            'proof_number': self.root_pn,
+            'disproof_number': self.root_dn,
+            'pn_table': self.pn_table.used if self.pn_table is not None else 0
         }
+        stats.update(self.parallel_stats)
+        return stats
 
     def CreateMoveOrdering(self):
         """
-        creates dictionary of move -> weight
+        creates list of square -> weight
         lower weights are better, and moves with lower weights will be picked first
         """
-        print("move ordering used")
+        if self.super_debug:
+            print("move ordering used")
 
-        self._ordering = defaultdict(float)
-        limit = self.board.size - 1
-        corners = [(0, 0), (0, limit), (limit, 0), (limit, limit)]
+        self._ordering = [0.0] * (self.board.size ** 2)
+        corners = self.board.Corners()
 
         # corners first
         for c in corners:
-            self._ordering[c] = -10
-            # so the ordering doesn't care about the format of the move (messy)
-            self._ordering[self.board.PointToStr(c)] += -10
+            self._ordering[c] += -10
 
         # points beside the corners are also weak
         for c in corners:
-            for p in self.board.AllPointsBeside(c):
-                self._ordering[p] = 10
-                # so the ordering doesn't care about the format of the move (messy)
-                self._ordering[self.board.PointToStr(p)] += 10
+            for p in BitsToIndices(self.board.neighbours[c]):
+                self._ordering[p] += 10
+
+        # fastest first weights, only the x squares are penalised
+        size = self.board.size
+        self._fastest = [0] * (size ** 2)
+        for c in corners:
+            x, y = self.board.MoveToPoint(c)
+            dx = 1 if x == 0 else -1
+            dy = 1 if y == 0 else -1
+            self._fastest[c] = FASTEST_CORNER_WEIGHT
+            self._fastest[size * (x + dx) + y + dy] = FASTEST_X_WEIGHT
 
     def CreateCaptureOrdering(self, moves=[]):
         # For each move, the fewer captures, the better
@@ -98,58 +224,124 @@ class OthelloPlayerAB:
 
     def CreateKiller(self):
         """
-        maps moves to number of beta cuts it did
+        creates the history table and the killer slots (all empty)
+        history[colour * area + square] adds up the beta cuts of a square
+        for a colour, weighted by the square of the empties left
+        killers[2 * empties], killers[2 * empties + 1] are the last two
+        moves that cut at a node with that many empties
         """
-        self._killer = {}
-
-        # basically corners will already be assumed
-        # to have created a bunch of beta cuts
-        # so they are prefered (if move ordering on too)
-        ordering_init_multiplier = (self.board.size ** 2) // 2
+        area = self.board.size ** 2
+        self._history = [0] * (3 * area)
+        self._killers = [NO_MOVE] * (2 * (area + 1))
 
-        if self.use_ordering:
-            if not self._ordering:
-                self.CreateMoveOrdering()
-            for key in self._ordering:
-                self._killer[key] = ordering_init_multiplier * self._ordering[key]
+    def AgeHistory(self):
+        """
+        halve the history, so older beta cuts count less than new ones
+        """
+        self._history = [h >> 1 for h in self._history]
 
     def UpdateKiller(self, m):
         """
-        incrememnts number of beta cuts for a move
+        record a beta cut of move m by the current player, in the history
+        table and the killer slots of the current number of empties
         """
-        if m not in self._killer:
-            self._killer[m] = 0
-        self._killer[m] += 1
+        empties = self.board.counts[EMPTY]
+        i = self.board.current_player * self.board.size ** 2 + m
+        self._history[i] += empties * empties
+        if self._history[i] > HISTORY_MAX:
+            self.AgeHistory()
+
+        slot = 2 * empties
+        if self._killers[slot] != m:
+            self._killers[slot + 1] = self._killers[slot]
+            self._killers[slot] = m
 
     def OrderMoves(self, moves):
         """
         orders moves based on the move ordering, lower is stronger and will
         be picked first
         """
-        ordering_new = self._ordering.copy()
+        ordering = self._ordering
+        num_captured = self.board.NumCaptured
 
-        for move in moves:
-            ordering_new[move] += self.board.NumCaptured(move)/1.5
-
-        sorted_moves = sorted(moves, key=lambda x: ordering_new.get(x, 0.0))
-
-        return sorted_moves
-        # return sorted(moves, key=lambda x: self._ordering.get(x, 0.0))
+        return sorted(moves, key=lambda x: ordering[x] + num_captured(x)/1.5)
 
     def OrderMovesNega(self, moves):
-        ordering = {}
+        if self.use_fastest_first:
+            return self.OrderFastestFirst(moves)
+        return sorted(moves, key=self.board.EvaluateMove)
 
-        for m in moves:
-            ordering[m] = self.board.EvaluateMove(m)
-        sorted_moves = sorted(moves, key=lambda x: ordering.get(x, 0.0))
+    def OrderFastestFirst(self, moves):
+        """
+        orders moves by the number of moves they leave the opponent, fewest
+        first, adjusted by the corner and x square weights
+        """
+        fastest = self._fastest
+        mobility_after = self.board.MobilityAfter
 
-        return sorted_moves
+        return sorted(moves, key=lambda x: mobility_after(x) + fastest[x])
 
-    def OrderKiller(self, moves):
+    def OrderKiller(self, moves, tt_move=NO_MOVE):
+        """
+        orders moves by the tt move, then the killers of this number of
+        empties, then the history of the current player (and the square
+        weights of the move ordering if use_ordering is set)
         """
-        orders moves based on the killer heuristic (better moves cause more beta cuts)
+        area = self.board.size ** 2
+        history = self._history
+        base = self.board.current_player * area
+        slot = 2 * self.board.counts[EMPTY]
+        first, second = self._killers[slot], self._killers[slot + 1]
+        ordering = self._ordering if self.use_ordering else None
+
+        def score(m):
+            value = history[base + m]
+            if m == tt_move:
+                value += 4 * KILLER_BONUS
+            elif m == first:
+                value += 2 * KILLER_BONUS
+            elif m == second:
+                value += KILLER_BONUS
+            if ordering is not None:
+                value -= area * ordering[m]
+            return -value
+
+        return sorted(moves, key=score)
+
+    def SortMoves(self, moves, tt_move=NO_MOVE):
         """
-        return sorted(moves, key=lambda x: self._killer.get(x, 0))
+        the one move ordering routine of the solvers: history and killers
+        if use_killer is set, otherwise fastest first if use_fastest_first
+        is set, otherwise the move ordering if use_ordering is set, with
+        tt_move (a known best move) always tried first
+        near the leaves (below order_min_empties) only tt_move is moved,
+        which only happens above endgame_empties, see __init__
+        """
+        ordered = self.board.counts[EMPTY] >= self.order_min_empties
+        if ordered and self.use_killer:
+            return self.OrderKiller(moves, tt_move)
+
+        if ordered and self.use_fastest_first:
+            moves = self.OrderFastestFirst(moves)
+        elif ordered and self.use_ordering:
+            moves = self.OrderMoves(moves)
+        if tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+        return moves
+
+    def SearchMoves(self):
+        """
+        legal moves of a non terminal position in the order the solvers
+        try them, [PASS] if the current player has to pass
+        """
+        moves = self.board.GetLegalMoves()
+
+        # not terminal, so the opponent can move after we pass
+        if not moves:
+            return [PASS]
+
+        return self.SortMoves(moves)
 
     def Solve(self):
         """
@@ -157,44 +349,261 @@ class OthelloPlayerAB:
         returns following:
         result, time_taken
         """
+        self.StartSearch()
+
+        if self.solver == DFPN:
+            result = self.Dfpn()
+        else:
+            result = self.negamaxBoolean()
+        self.time_taken = time() - self.start
+        winner, score = self.board.Winner()
+
+        if self.aborted:
+            return ABORTED, -1, -1
+
+        return result, time() - self.start, score
+
+    def SolveExact(self):
+        """
+        exact final disc differential of the current position for the
+        current player, with MTD(f) over null window negamaxExact searches
+        (always uses the transposition table, it holds the bounds)
+        returns following:
+        score, principal variation, time_taken
+        score is None if the search was aborted
+        """
+        self.StartSearch()
+
+        score = self.MTDF(self.ExactGuess())
+        self.time_taken = time() - self.start
+
+        if self.aborted:
+            return None, [], self.time_taken
+
+        return score, self.PrincipalVariation(), self.time_taken
+
+    def ExactGuess(self):
+        """
+        first guess for MTD(f), from the tt if it knows the position
+        """
+        entry = self.TTProbe()
+        if entry is None:
+            return 0
+
+        lower, upper, _ = entry
+        return max(lower, min(upper, 0))
+
+    def MTDF(self, guess):
+        """
+        narrows [lower, upper] around the exact score with null window
+        searches, starting at guess
+        """
+        # one past the possible scores, so both final bounds get searched
+        # (and stored in the tt for the principal variation)
+        area = self.board.size ** 2
+        lower = -area - 1
+        upper = area + 1
+        score = guess
+
+        while lower < upper:
+            beta = max(score, lower + 1)
+            score = self.negamaxExact(beta - 1, beta)
+            if self.aborted:
+                break
+
+            if score < beta:
+                upper = score
+            else:
+                lower = score
+
+        return score
+
+    def PrincipalVariation(self):
+        """
+        best moves from the current position, read back from the tt
+        or the database
+        """
+        pv = []
+        # every move fills a square or is a (single) pass
+        for _ in range(2 * self.board.counts[EMPTY]):
+            if self.board.Terminal():
+                break
+
+            entry = self.TTProbe()
+            if entry is None or entry[0] != entry[1] or entry[2] == NO_MOVE:
+                db_entry = self.DBProbe()
+                if db_entry is not None and (entry is None or db_entry[0] == db_entry[1]):
+                    entry = db_entry
+
+            if entry is not None and entry[0] == entry[1] and entry[2] != NO_MOVE:
+                move = entry[2]
+            else:
+                # a stability cut, the endgame solver, the database (or a
+                # replaced tt entry) left no best move, find one reaching
+                # the score (searched again if it is not known either)
+                if entry is not None and entry[0] == entry[1]:
+                    score = entry[0]
+                else:
+                    score = self.MTDF(self.ExactGuess())
+                move = NO_MOVE
+                if not self.aborted:
+                    move = self.ExactMove(score)
+                if move == NO_MOVE:
+                    break
+
+            pv.append(move)
+            self.MakeMove(move)
+
+        for m in reversed(pv):
+            self.UnmakeMove(m)
+        return pv
+
+    def ExactMove(self, score):
+        """
+        a move reaching score, the exact score of the current (non
+        terminal) position, found with a null window search after every
+        move, NO_MOVE if the search was aborted
+        """
+        for m in self.SearchMoves():
+            self.MakeMove(m)
+            value = -self.negamaxExact(-score, -score + 1)
+            self.UnmakeMove(m)
+
+            if self.aborted:
+                break
+            if value >= score:
+                return m
+        return NO_MOVE
+
+    def StartSearch(self):
+        """
+        reset clock and statistics before Solve or SolveExact
+        """
         self.start = time()
+        self.search_time = self.time_limit
         self.beta_cuts = 0
+        self.stability_cuts = 0
         self.searches = 0
         self.terminals = 0
         self.tt_hits = 0
         self.tt_misses = 0
-        self.tt_gcs = 0
+        self.db_hits = 0
+        self.db_writes = 0
         self.time_taken = 0
+        self.aborted = False
+        self.parallel_stats = {}
 
         # if the size of the current board search is different than
         # previous, we need to reset the transposition table
         # we can also take this chance to reset the ordering table
         if self.tt_size != self.board.size:
-            self.tt = {}
+            self.tt.Clear()
             self.tt_size = self.board.size
             self.CreateMoveOrdering()
             self.CreateKiller()
-
-        if self.use_killer and self.use_ordering:
-            print("warning: if both use_killer and use_ordering are set, killer heuristic will not be used")
-
-        result = self.negamaxBoolean()
-        self.time_taken = time() - self.start
-        winner, score = self.board.Winner()
-
-        if self.Abort():
-            return ABORTED, -1, -1
-
-        return result, time() - self.start, score
+        else:
+            self.AgeHistory()
+        self.tt.NewSearch()
+        if self.endgame is None or self.endgame.size != self.board.size:
+            self.endgame = EndgameSolver(self.board.size)
+        self.endgame.nodes = 0
+        self.board.TrackSymmetry(self.use_symmetry)
+        # the solvers do not evaluate positions
+        self.board.TrackPatterns(None)
 
     def Abort(self):
         """
         return true if we should abort currently running search
         """
-        if time() - self.start > self.time_limit:
+        if time() - self.start > self.search_time:
             return True
+        if self.cancel_flags is not None:
+            return bool(self.cancel_flags[0] or self.cancel_flags[self.cancel_index])
         return False
 
+    def MoveTime(self):
+        """
+        time BestMove may spend on the current position, based on how
+        many moves we still have to make (half the empty squares)
+        """
+        own_moves = max(1, (self.board.counts[EMPTY] + 1) // 2)
+        return min(self.time_limit, MOVE_TIME_SHARE * self.time_limit / own_moves)
+
+    def WinThreshold(self):
+        """
+        smallest final disc differential (for the player to move) that wins,
+        komi goes to black
+        """
+        komi = self.board.komi
+        if self.board.CurrentPlayer() == BLACK:
+            return floor(-komi) + 1
+        return floor(komi) + 1
+
+    def StabilityCut(self, alpha, beta):
+        """
+        bound on the final disc differential for the player to move from
+        the stable discs, if it lies outside (alpha, beta), None otherwise
+        the opponent keeps its stable discs (we score at most area - 2 * them),
+        and we keep ours (we score at least 2 * ours - area)
+        """
+        board = self.board
+        area = board.size ** 2
+        player = board.current_player
+
+        # stable discs are a subset of the discs, so most positions are
+        # ruled out by the disc counts without computing them
+        if area - 2 * board.counts[opp(player)] <= alpha:
+            upper = area - 2 * board.StableDiscs(opp(player)).bit_count()
+            if upper <= alpha:
+                self.stability_cuts += 1
+                return upper
+
+        if 2 * board.counts[player] - area >= beta:
+            lower = 2 * board.StableDiscs(player).bit_count() - area
+            if lower >= beta:
+                self.stability_cuts += 1
+                return lower
+
+        return None
+
+    def TTKey(self):
+        """
+        returns (key, t) to use for the tt, t is the symmetry transform
+        taking the board to the position the key belongs to
+        """
+        if self.use_symmetry:
+            return self.board.CanonicalKey()
+        return self.board.Hash(), 0
+
+    def TTProbe(self):
+        """
+        returns (lower, upper, move) stored for the board, None if not stored
+        move is mapped back from the stored position to the board
+        """
+        key, t = self.TTKey()
+        entry = self.tt.Probe(key)
+        if entry is None or not t:
+            return entry
+
+        lower, upper, move = entry
+        return lower, upper, self.board.InverseTransformMove(move, t)
+
+    def DBProbe(self):
+        """
+        TTProbe for the solved position database, None without one
+        """
+        if self.db is None:
+            return None
+
+        key, t = self.TTKey()
+        entry = self.db.Probe(key)
+        if entry is None:
+            return None
+
+        self.db_hits += 1
+        lower, upper, move = entry
+        return lower, upper, self.board.InverseTransformMove(move, t)
+
     def TTread(self):
         """
         read result from the transposition table
@@ -202,40 +611,97 @@ class OthelloPlayerAB:
         if not self.use_tt:
             return None
 
-        _key = self.board.Hash()
+        entry = self.TTProbe()
+
+        if entry is not None:
+            result = self.BoundsResult(entry[0], entry[1])
 
-        # tt hit
-        if _key in self.tt:
-            self.tt_hits += 1
-            return self.tt[_key]
+            # tt hit, the stored bounds decide the game
+            if result is not None:
+                self.tt_hits += 1
+                return result
 
         # tt miss
-        else:
-            self.tt_misses += 1
+        self.tt_misses += 1
+        return None
+
+    def DBread(self):
+        """
+        read result from the solved position database
+        """
+        if self.db is None:
+            return None
+
+        key, _ = self.TTKey()
+        entry = self.db.Probe(key)
+        if entry is None:
             return None
 
-    def TTwrite(self, result):
+        result = self.BoundsResult(entry[0], entry[1])
+        if result is not None:
+            self.db_hits += 1
+        return result
+
+    def BoundsResult(self, lower, upper):
         """
-        write result to the transpotition table
+        WIN or LOSS if bounds on the final disc differential decide the game,
+        None otherwise
         """
-        if not self.use_tt:
+        threshold = self.WinThreshold()
+        if lower >= threshold:
+            return WIN
+        if upper < threshold:
+            return LOSS
+        return None
+
+    def TTwrite(self, result, move=NO_MOVE, nodes=1):
+        """
+        write result to the transpotition table, and to the database
+        when the result took at least db_min_nodes searches to prove
+        results are stored as bounds on the final disc differential
+        """
+        if not self.use_tt and self.db is None:
             return
 
-        _key = self.board.Hash()
-        self.tt[_key] = result
+        threshold = self.WinThreshold()
+        if result == WIN:
+            self.TTstore(threshold, SCORE_MAX, move, nodes, self.use_tt)
+        else:
+            self.TTstore(SCORE_MIN, threshold - 1, move, nodes, self.use_tt)
 
-        # garbage collection, make sure tt doesnt get too big and hit swap
-        to_remove = []
-        if len(self.tt) > self.tt_size:
-            self.tt_gcs += 1
-            # use sampling to remove 0.25N items from the tt
-            for _key in self.tt.keys():
-                if randint(0, 3) == 0:
-                    to_remove.append(_key)
+    def TTstore(self, lower, upper, move=NO_MOVE, nodes=1, to_tt=True):
+        """
+        store bounds on the final disc differential for the board in the tt
+        (if to_tt), and in the database when they took at least
+        db_min_nodes searches
+        """
+        if self.aborted:
+            return
+
+        to_db = self.db is not None and nodes >= self.db_min_nodes
+        if not to_tt and not to_db:
+            return
+
+        key, t = self.TTKey()
+        move = self.board.TransformMove(move, t)
+        if to_tt:
+            self.tt.Store(key, lower, upper, move, nodes, self.board.counts[EMPTY])
+        if to_db:
+            self.db.Store(key, lower, upper, move, nodes)
+            self.db_writes += 1
+
+    def MakeMove(self, m):
+        """
+        play m on the board, m may be PASS
+        """
+        if not self.board.Play(m):
+            raise RuntimeError("illegal move played")
 
-        # clean up all the chosen enteries
-        for _key in to_remove:
-            del self.tt[_key]
+    def UnmakeMove(self, m):
+        """
+        undo MakeMove(m)
+        """
+        self.board.Undo()
 
     def negamaxBoolean(self):
         """
@@ -244,16 +710,36 @@ class OthelloPlayerAB:
         """
         self.searches += 1
 
-        if len(self.board.move_history) > self.board.size ** 2 - 4:
+        # every move but the last can be followed by a pass
+        if self.board.ply > 2 * (self.board.size ** 2 - 4):
             raise RuntimeError("move history too long")
 
         if self.Abort():
+            self.aborted = True
+            return LOSS
+
+        if self.board.counts[EMPTY] <= self.endgame_empties:
+            threshold = self.WinThreshold()
+            if self.endgame.Solve(self.board, threshold - 1, threshold) >= threshold:
+                return WIN
             return LOSS
 
+        searches = self.searches
+
         tt_res = self.TTread()
         if tt_res is not None:
             return tt_res
 
+        db_res = self.DBread()
+        if db_res is not None:
+            return db_res
+
+        if self.use_stability:
+            threshold = self.WinThreshold()
+            bound = self.StabilityCut(threshold - 1, threshold)
+            if bound is not None:
+                return WIN if bound >= threshold else LOSS
+
         if self.board.Terminal():
 
             self.terminals += 1
@@ -274,95 +760,327 @@ class OthelloPlayerAB:
         if self.super_debug:
             print(self.board)
 
-        # Get moves and then order them
-        moves = self.board.GetLegalMoves()
-
-        if self.use_ordering and not self.use_killer:
-            moves = self.OrderMovesNega(moves)
-
-        elif self.use_killer:
-            moves = self.OrderKiller(moves)
-
-        for m in moves:
-
-            if not self.board.Play(m):
-                raise RuntimeError("illegal move played")
+        for m in self.SearchMoves():
 
+            self.MakeMove(m)
             result = Nega(self.negamaxBoolean())
-            self.board.Undo()
+            self.UnmakeMove(m)
 
             if result == WIN:
                 self.beta_cuts += 1
                 if self.super_debug:
                     print("beta cut")
 
-                if self.use_killer:
+                if self.use_killer and m != PASS:
                     self.UpdateKiller(m)
 
-                self.TTwrite(WIN)
+                self.TTwrite(WIN, m, self.searches - searches)
                 return WIN
 
-        self.TTwrite(LOSS)
+        self.TTwrite(LOSS, NO_MOVE, self.searches - searches)
         return LOSS
 
+    def negamaxExact(self, alpha, beta):
+        """
+        fail soft principal variation search of the final disc differential
+        for the player to move, searching the first move with the full
+        window and the rest with a null window (re-searched if they beat alpha)
+        bounds found are stored in the tt
+        """
+        self.searches += 1
+
+        if self.Abort():
+            self.aborted = True
+            return alpha
+
+        if self.board.counts[EMPTY] <= self.endgame_empties:
+            return self.endgame.Solve(self.board, alpha, beta)
+
+        searches = self.searches
+
+        entry = self.TTProbe()
+        if entry is None:
+            entry = self.DBProbe()
+
+        tt_move = NO_MOVE
+        if entry is not None:
+            lower, upper, tt_move = entry
+            if lower >= beta or lower == upper:
+                self.tt_hits += 1
+                return lower
+            if upper <= alpha:
+                self.tt_hits += 1
+                return upper
+            alpha = max(alpha, lower)
+            beta = min(beta, upper)
+        else:
+            self.tt_misses += 1
+
+        if self.use_stability:
+            bound = self.StabilityCut(alpha, beta)
+            if bound is not None:
+                return bound
+        alpha_orig = alpha
+
+        moves = self.board.GetLegalMoves()
+        if not moves:
+            if self.board.Terminal():
+                # game over, nobody can move
+                player = self.board.CurrentPlayer()
+                self.terminals += 1
+                score = self.board.counts[player] - self.board.counts[opp(player)]
+                self.TTstore(score, score)
+                return score
+
+            self.board.Play(PASS)
+            score = -self.negamaxExact(-beta, -alpha)
+            self.board.Undo()
+            moves = [PASS]
+            best = score
+            best_move = PASS
+        else:
+            moves = self.SortMoves(moves, tt_move)
+
+            best = -SCORE_MAX
+            best_move = NO_MOVE
+            for i, m in enumerate(moves):
+                self.board.Play(m)
+                if i == 0:
+                    score = -self.negamaxExact(-beta, -alpha)
+                else:
+                    score = -self.negamaxExact(-alpha - 1, -alpha)
+                    if alpha < score < beta:
+                        score = -self.negamaxExact(-beta, -score)
+                self.board.Undo()
+
+                if score > best:
+                    best = score
+                    best_move = m
+                if score > alpha:
+                    alpha = score
+                if alpha >= beta:
+                    self.beta_cuts += 1
+                    if self.use_killer:
+                        self.UpdateKiller(m)
+                    break
+
+        nodes = self.searches - searches + 1
+        if best <= alpha_orig:
+            # no move is known to be best when they all fail low
+            if len(moves) > 1:
+                best_move = NO_MOVE
+            self.TTstore(SCORE_MIN, best, best_move, nodes)
+        elif best >= beta:
+            self.TTstore(best, SCORE_MAX, best_move, nodes)
+        else:
+            self.TTstore(best, best, best_move, nodes)
+        return best
+
+    def Dfpn(self):
+        """
+        depth first proof number search (df-pn) of the current position
+        returns WIN or LOSS for the current player, like negamaxBoolean
+        """
+        if self.pn_table is None or self.pn_table.limit != self.pn_table_limit:
+            self.pn_table = ProofNumberTable(self.pn_table_limit)
+        else:
+            self.pn_table.Clear()
+        key, _ = self.TTKey()
+        self.root_pn, self.root_dn = self.dfpnMID(key, PN_INF, PN_INF)
+
+        if self.root_pn == 0:
+            return WIN
+        return LOSS
+
+    def dfpnResult(self, key, result):
+        """
+        store a proven result in the proof number table, returns (pn, dn)
+        """
+        if result == WIN:
+            numbers = (0, PN_INF)
+        else:
+            numbers = (PN_INF, 0)
+        self.pn_table.Store(key, *numbers)
+        return numbers
+
+    def dfpnMID(self, key, thpn, thdn):
+        """
+        expands the current position (tt key <key>) until its proof number
+        reaches thpn or its disproof number reaches thdn
+        numbers are for the player to move, so a node's pn is the smallest
+        dn of its children, and its dn is the sum of its children's pn
+        returns (pn, dn) of the position
+        """
+        self.searches += 1
+        searches = self.searches
+
+        if self.Abort():
+            self.aborted = True
+            return thpn, thdn
+
+        if self.board.Terminal():
+            self.terminals += 1
+            winner, _ = self.board.Winner()
+
+            if self.board.CurrentPlayer() == winner:
+                self.TTwrite(WIN)
+                return self.dfpnResult(key, WIN)
+
+            self.TTwrite(LOSS)
+            return self.dfpnResult(key, LOSS)
+
+        # children [move, key, pn, dn] are made once, and proven children are
+        # taken from the tt/database before they are ever expanded
+        # the numbers are kept here while we search, the table may drop them
+        children = []
+        for m in self.board.GetLegalMoves() or [PASS]:
+            self.MakeMove(m)
+            child_key, _ = self.TTKey()
+            numbers = self.pn_table.Probe(child_key)
+            if numbers is None:
+                result = self.TTread()
+                if result is None:
+                    result = self.DBread()
+                if result is not None:
+                    numbers = self.dfpnResult(child_key, result)
+                else:
+                    numbers = (1, 1)
+            self.UnmakeMove(m)
+            children.append([m, child_key, numbers[0], numbers[1]])
+
+        while True:
+            pn = PN_INF
+            dn = 0
+            second_dn = PN_INF
+            best = None
+            best_pn = 0
+            for child in children:
+                child_pn = child[2]
+                child_dn = child[3]
+                if child_dn < pn:
+                    second_dn = pn
+                    pn = child_dn
+                    best = child
+                    best_pn = child_pn
+                elif child_dn < second_dn:
+                    second_dn = child_dn
+                dn += child_pn
+            dn = min(dn, PN_INF)
+
+            if pn >= thpn or dn >= thdn or self.aborted:
+                break
+
+            # the best child may run past the second best (1 + epsilon trick
+            # with epsilon 1), so we switch between children less often and
+            # re-expand less of what the table dropped
+            child_thpn = min(PN_INF, thdn - dn + best_pn)
+            child_thdn = min(thpn, 2 * second_dn + 1)
+
+            self.MakeMove(best[0])
+            best[2], best[3] = self.dfpnMID(best[1], child_thpn, child_thdn)
+            self.UnmakeMove(best[0])
+
+        if self.aborted:
+            return pn, dn
+
+        self.pn_table.Store(key, pn, dn, self.searches - searches + 1)
+        if pn == 0:
+            self.TTwrite(WIN, best[0], self.searches - searches + 1)
+        elif dn == 0:
+            self.TTwrite(LOSS, NO_MOVE, self.searches - searches + 1)
+        return pn, dn
+
     def BestMove(self):
         """
-        solves board's current position for the current player
+        picks a move for the current player with iterative deepening,
+        searching depth 1, 2, 3... until the move's time (MoveTime) runs out
         returns following:
-        result, time_taken
+        max_reached, best_move, results of the last finished iteration
         """
-
-        # if the size of the current board search is different than
-        # previous, we need to reset the transposition table
-        # we can also take this chance to reset the ordering table
-        if self.tt_size != self.board.size:
-            self.tt = {}
-            self.tt_size = self.board.size
-            self.CreateMoveOrdering()
-            self.CreateKiller()
+        self.PrepareBestMove()
 
         first_moves = self.board.GetLegalMoves()
         solving_for = self.board.current_player
         results = []
 
         if len(first_moves) == 0:
-            return [self.max_reached, False, results]
+            return [False, PASS, results]
 
-        max_depth = 20
+        corners = self.board.Corners()
+        for first_move in first_moves:
+            if first_move in corners:
+                return [False, first_move, results]
 
-        if self.board.size == 5:
-            max_depth = 7
-        if self.board.size == 6:
-            max_depth = 6
-        if self.board.size == 7:
-            max_depth = 5
-        if self.board.size == 8:
-            max_depth = 5
-        if self.board.size > 8:
-            max_depth = 4
+        self.start = time()
+        self.search_time = self.MoveTime()
+        self.aborted = False
 
-        for first_move in first_moves:
-            self.first_state_values[(first_move, solving_for)] = 0
+        # cheap ordering until the first iteration finishes
+        first_moves = self.OrderMovesNega(first_moves)
+        best_move = first_moves[0]
+        max_reached = True
+        depth = 1
 
-        limit = self.board.size - 1
-        corners = [(0, 0), (0, limit), (limit, 0), (limit, limit)]
-        for first_move in first_moves:
-            for corner in corners:
-                if first_move == self.board.PointToStr(corner):
-                    return [self.max_reached, first_move, results]
+        while max_reached and depth <= self.board.counts[EMPTY]:
+            self.max_reached = False
+            iteration = []
 
-            self.board.Play(first_move)
-            results.append([self.negamaxBooleanWithDepth(0, first_move, solving_for, max_depth),
-                            first_move, self.board.current_player])
-            self.board.Undo()
+            for first_move in first_moves:
+                result = self.SearchFirstMove(first_move, depth)
+                iteration.append([result, first_move, opp(solving_for)])
+
+                if self.aborted:
+                    break
+
+                # the opponent loses after this move, no need to look further
+                if result == LOSS:
+                    return [False, first_move, iteration]
 
-        legal_moves = {}
-        for move in first_moves:
-            legal_moves[move] = self.first_state_values[(move, solving_for)]
+            # keep the last finished iteration on timeout
+            if self.aborted:
+                break
 
-        Keymax = max(legal_moves, key=legal_moves.get)
+            results = iteration
+            max_reached = self.max_reached
 
-        return [self.max_reached, Keymax, results]
+            # moves the opponent wins after are only picked if all moves lose
+            not_losing = [r[1] for r in results if r[0] != WIN] or first_moves
+            best_move = max(not_losing, key=lambda m: self.first_state_values[(m, solving_for)])
+
+            # search the best move first next iteration
+            first_moves.remove(best_move)
+            first_moves.insert(0, best_move)
+            depth += 1
+
+        return [max_reached, best_move, results]
+
+    def PrepareBestMove(self):
+        """
+        set up the tables and pattern evaluator BestMove uses
+        """
+        # if the size of the current board search is different than
+        # previous, we need to reset the transposition table
+        # we can also take this chance to reset the ordering table
+        if self.tt_size != self.board.size:
+            self.tt.Clear()
+            self.tt_size = self.board.size
+            self.CreateMoveOrdering()
+            self.CreateKiller()
+        self.board.TrackPatterns(self.evaluators.get(self.board.size))
+
+    def SearchFirstMove(self, first_move, max_depth):
+        """
+        one iteration of BestMove for first_move, searching <max_depth> plies
+        after it, also sets its first_state_values
+        returns the result for the opponent (who moves after first_move)
+        """
+        solving_for = self.board.current_player
+        self.first_state_values[(first_move, solving_for)] = 0
+
+        self.board.Play(first_move)
+        result = self.negamaxBooleanWithDepth(0, first_move, solving_for, max_depth)
+        self.board.Undo()
+        return result
 
     def negamaxBooleanWithDepth(self, depth, first_move, solving_for, max_depth):
         """
@@ -371,6 +1089,10 @@ class OthelloPlayerAB:
         """
         self.searches += 1
 
+        if self.Abort():
+            self.aborted = True
+            return MAXIMUM_DEPTH
+
         # Depth limit, get a value function for all of the original actions.
         if depth == max_depth and self.board.size > 4:
             self.max_reached = True
@@ -385,24 +1107,49 @@ class OthelloPlayerAB:
                 return WIN
             return LOSS
 
-        # Get moves and then order them
-        moves = self.OrderMovesNegaWithListing(self.board.GetLegalMoves(), first_move, solving_for)
+        # Get moves and then order them, passing if we have none
+        moves = self.board.GetLegalMoves()
+        if moves:
+            moves = self.OrderMovesNegaWithListing(moves, first_move, solving_for)
+        else:
+            moves = [PASS]
 
+        unknown = False
         for move in moves:
 
-            self.board.Play(move)
+            self.MakeMove(move)
             result = Nega(self.negamaxBooleanWithDepth(depth + 1, first_move, solving_for, max_depth))
-            self.board.Undo()
+            self.UnmakeMove(move)
 
             if result == WIN:
                 return WIN
+            if result == MAXIMUM_DEPTH:
+                unknown = True
+
+        # only a loss if every move was searched to the end
+        if unknown:
+            return MAXIMUM_DEPTH
         return LOSS
 
+    def MoveValue(self, m):
+        """
+        value of move m for the player making it, lower is better
+        with a pattern evaluator this is the evaluation of the position
+        after m (for the opponent), otherwise EvaluateMove
+        """
+        if self.board.patterns is None:
+            return self.board.EvaluateMove(m)
+
+        self.board.Play(m)
+        value = self.board.EvaluatePatterns()
+        self.board.Undo()
+        return value
+
     def OrderMovesNegaWithListing(self, moves, first_move, solving_for):
         ordering = {}
 
         for m in moves:
-            move_value = self.board.EvaluateMove(m)
+            move_value = self.MoveValue(m)
             ordering[m] = move_value
 
             if self.board.current_player == solving_for:
@@ -411,8 +1158,7 @@ class OthelloPlayerAB:
             else:
                 self.first_state_values[(first_move, solving_for)] += move_value
 
-        sorted_moves = sorted(moves, key=lambda x: ordering.get(x, 0.0))
-        return sorted_moves
+        return sorted(moves, key=ordering.__getitem__)
 
 
 def Nega(result):
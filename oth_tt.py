@@ -0,0 +1,356 @@
+"""
+fixed size transposition table for the Othello solvers
+entries live in parallel arrays (not a dict), grouped in small buckets
+indexed by the low bits of the board's zobrist key
+ProofNumberTable keeps df-pn's (pn, dn) numbers the same way
+SharedTranspositionTable keeps its entries in shared memory, so solver
+processes working on the same search can use one table
+"""
+
+from array import array
+from multiprocessing import shared_memory
+
+# bounds are on the final disc differential for the player to move
+SCORE_MIN = -30000
+SCORE_MAX = 30000
+
+# stored when an entry has no best move (PASS is a real move)
+NO_MOVE = -2
+
+# entries per bucket, a new entry may replace any entry of its bucket
+BUCKET_SIZE = 4
+
+# key, lower, upper, move, nodes, depth, age
+ENTRY_BYTES = 8 + 2 + 2 + 2 + 4 + 1 + 1
+
+MAX_NODES = 0xFFFFFFFF
+
+def Buckets(records, bucket_size=BUCKET_SIZE):
+    """
+    number of buckets of a table of at most <records> records,
+    rounded down to a power of two
+    """
+    buckets = 1
+    while buckets * 2 * bucket_size <= records:
+        buckets *= 2
+    return buckets
+
+def Signed16(value):
+    """
+    reads a 16 bit field back as a signed value
+    """
+    value &= 0xFFFF
+    if value & 0x8000:
+        return value - 0x10000
+    return value
+
+class TranspositionTable:
+
+    def __init__(self, size_mb=16):
+        """
+        create a table using roughly <size_mb> megabytes
+        """
+        self.age = 0
+        self.Resize(size_mb)
+
+    def Resize(self, size_mb):
+        """
+        reallocate the table with roughly <size_mb> megabytes, clearing it
+        the number of buckets is rounded down to a power of two
+        """
+        buckets = Buckets(int(size_mb * 1024 * 1024) // ENTRY_BYTES)
+
+        self.size_mb = size_mb
+        self.mask = buckets - 1
+        self.capacity = buckets * BUCKET_SIZE
+        self.Clear()
+
+    def Clear(self):
+        """
+        remove every entry
+        """
+        n = self.capacity
+        self.keys = array('Q', bytes(8 * n))
+        self.lower = array('h', bytes(2 * n))
+        self.upper = array('h', bytes(2 * n))
+        self.moves = array('h', bytes(2 * n))
+        self.nodes = array('I', bytes(array('I').itemsize * n))
+        self.depths = array('B', bytes(n))
+        self.ages = array('B', bytes(n))
+
+        self.used = 0
+        self.overwrites = 0
+
+    def NewSearch(self):
+        """
+        entries stored before this call are replaced before newer ones
+        """
+        self.age = (self.age + 1) & 0xFF
+
+    def Probe(self, key):
+        """
+        returns (lower, upper, move) stored for key, None if not stored
+        """
+        keys = self.keys
+        base = (key & self.mask) * BUCKET_SIZE
+        for i in range(base, base + BUCKET_SIZE):
+            if keys[i] == key:
+                return self.lower[i], self.upper[i], self.moves[i]
+        return None
+
+    def Store(self, key, lower, upper, move=NO_MOVE, nodes=1, depth=0):
+        """
+        store bounds for key, tightening the bounds already stored for it
+        otherwise replaces an empty entry, or the entry of the bucket
+        from the oldest search with the smallest subtree
+        """
+        keys = self.keys
+        base = (key & self.mask) * BUCKET_SIZE
+
+        slot = -1
+        slot_value = -1
+        for i in range(base, base + BUCKET_SIZE):
+            k = keys[i]
+            if k == key:
+                if self.lower[i] > lower:
+                    lower = self.lower[i]
+                if self.upper[i] < upper:
+                    upper = self.upper[i]
+                if move == NO_MOVE:
+                    move = self.moves[i]
+                if self.nodes[i] > nodes:
+                    nodes = self.nodes[i]
+                slot = i
+                break
+
+            if k == 0:
+                slot = i
+                self.used += 1
+                break
+
+            value = self.nodes[i] + self.depths[i]
+            if self.ages[i] == self.age:
+                value += MAX_NODES
+            if slot == -1 or value < slot_value:
+                slot = i
+                slot_value = value
+        else:
+            self.overwrites += 1
+
+        keys[slot] = key
+        self.lower[slot] = lower
+        self.upper[slot] = upper
+        self.moves[slot] = move
+        self.nodes[slot] = min(nodes, MAX_NODES)
+        self.depths[slot] = min(depth, 0xFF)
+        self.ages[slot] = self.age
+
+class ProofNumberTable:
+
+    def __init__(self, entries=1000000):
+        """
+        create a table of (pn, dn) for df-pn with at most <entries> entries
+        """
+        self.limit = entries
+        buckets = Buckets(entries)
+        self.mask = buckets - 1
+        self.capacity = buckets * BUCKET_SIZE
+        self.Clear()
+
+    def Clear(self):
+        """
+        remove every entry
+        """
+        n = self.capacity
+        itemsize = array('I').itemsize
+        self.keys = array('Q', bytes(8 * n))
+        self.pn = array('I', bytes(itemsize * n))
+        self.dn = array('I', bytes(itemsize * n))
+        self.nodes = array('I', bytes(itemsize * n))
+
+        self.used = 0
+        self.overwrites = 0
+
+    def Probe(self, key):
+        """
+        returns (pn, dn) stored for key, None if not stored
+        """
+        keys = self.keys
+        base = (key & self.mask) * BUCKET_SIZE
+        for i in range(base, base + BUCKET_SIZE):
+            if keys[i] == key:
+                return self.pn[i], self.dn[i]
+        return None
+
+    def Store(self, key, pn, dn, nodes=1):
+        """
+        store (pn, dn) for key, replacing the numbers already stored for it
+        (whose subtree size is added to nodes)
+        otherwise replaces an empty entry, or the entry of the bucket with
+        the smallest subtree, so the most expensive proof work is kept
+        """
+        keys = self.keys
+        base = (key & self.mask) * BUCKET_SIZE
+
+        slot = -1
+        slot_nodes = -1
+        for i in range(base, base + BUCKET_SIZE):
+            k = keys[i]
+            if k == key:
+                nodes += self.nodes[i]
+                slot = i
+                break
+
+            if k == 0:
+                slot = i
+                self.used += 1
+                break
+
+            if slot == -1 or self.nodes[i] < slot_nodes:
+                slot = i
+                slot_nodes = self.nodes[i]
+        else:
+            self.overwrites += 1
+
+        keys[slot] = key
+        self.pn[slot] = pn
+        self.dn[slot] = dn
+        self.nodes[slot] = min(nodes, MAX_NODES)
+
+# shared table records are two 64 bit words: key ^ data, data
+# (a reader only accepts a record whose words xor back to its key, so a
+# record torn by a concurrent write in another process reads as a miss)
+SHARED_RECORD_BYTES = 16
+
+def PackEntry(lower, upper, move, weight, age):
+    """
+    packs a shared table entry into one 64 bit word
+    """
+    return ((lower & 0xFFFF)
+            | (upper & 0xFFFF) << 16
+            | (move & 0xFFFF) << 32
+            | (weight & 0xFF) << 48
+            | (age & 0xFF) << 56)
+
+class SharedTranspositionTable:
+
+    def __init__(self, size_mb=16, name=None):
+        """
+        create a table of roughly <size_mb> megabytes in shared memory,
+        or attach to the existing table called <name>
+        only the creating process may clear the table or start new searches
+        """
+        self.words = None
+        self.owner = name is None
+        self.used = 0
+        self.overwrites = 0
+
+        if self.owner:
+            buckets = Buckets(int(size_mb * 1024 * 1024) // SHARED_RECORD_BYTES)
+            # one extra record holds the search age
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=(buckets * BUCKET_SIZE + 1) * SHARED_RECORD_BYTES)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            buckets = (self.shm.size // SHARED_RECORD_BYTES - 1) // BUCKET_SIZE
+
+        self.size_mb = size_mb
+        self.name = self.shm.name
+        self.mask = buckets - 1
+        self.capacity = buckets * BUCKET_SIZE
+        self.words = self.shm.buf[:(self.capacity + 1) * SHARED_RECORD_BYTES].cast('Q')
+        self.age = self.words[2 * self.capacity]
+
+        if self.owner:
+            self.Clear()
+
+    def __del__(self):
+        self.Close()
+
+    def Close(self):
+        """
+        detach from the shared memory, freeing it if we created it
+        """
+        if self.words is None:
+            return
+        self.words.release()
+        self.words = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def Resize(self, size_mb):
+        raise RuntimeError("a shared transposition table can not be resized")
+
+    def Clear(self):
+        """
+        remove every entry
+        """
+        if not self.owner:
+            return
+        self.shm.buf[:len(self.words) * 8] = bytes(len(self.words) * 8)
+        self.used = 0
+        self.overwrites = 0
+        self.age = 0
+
+    def NewSearch(self):
+        """
+        entries stored before this call are replaced before newer ones
+        (processes attached to the table follow the creator's searches)
+        """
+        if self.owner:
+            self.words[2 * self.capacity] = (self.age + 1) & 0xFF
+        self.age = self.words[2 * self.capacity]
+
+    def Probe(self, key):
+        """
+        returns (lower, upper, move) stored for key, None if not stored
+        """
+        words = self.words
+        base = (key & self.mask) * BUCKET_SIZE
+        for i in range(2 * base, 2 * base + 2 * BUCKET_SIZE, 2):
+            data = words[i + 1]
+            if words[i] ^ data == key:
+                return Signed16(data), Signed16(data >> 16), Signed16(data >> 32)
+        return None
+
+    def Store(self, key, lower, upper, move=NO_MOVE, nodes=1, depth=0):
+        """
+        store bounds for key, like TranspositionTable.Store
+        the subtree size is kept as its bit length
+        """
+        words = self.words
+        base = (key & self.mask) * BUCKET_SIZE
+        weight = min(nodes.bit_length() + depth, 0xFF)
+
+        slot = -1
+        slot_value = -1
+        for i in range(2 * base, 2 * base + 2 * BUCKET_SIZE, 2):
+            data = words[i + 1]
+            check = words[i]
+            if check ^ data == key:
+                lower = max(lower, Signed16(data))
+                upper = min(upper, Signed16(data >> 16))
+                if move == NO_MOVE:
+                    move = Signed16(data >> 32)
+                weight = max(weight, (data >> 48) & 0xFF)
+                slot = i
+                break
+
+            if check == 0 and data == 0:
+                slot = i
+                self.used += 1
+                break
+
+            value = (data >> 48) & 0xFF
+            if data >> 56 == self.age:
+                value += 0x100
+            if slot == -1 or value < slot_value:
+                slot = i
+                slot_value = value
+        else:
+            self.overwrites += 1
+
+        data = PackEntry(lower, upper, move, weight, self.age)
+        words[slot + 1] = data
+        words[slot] = key ^ data
@@ -0,0 +1,217 @@
+"""
+trains pattern evaluation weights (see oth_pattern) from self-play games
+    python train.py <size> <games> [--weights weights_8x8.bin] [--data games_8x8.bin]
+games are played by worker processes and streamed to the data file as
+they finish, the weights are then fitted to the final disc differentials
+of all positions in the data file (including those of earlier runs)
+"""
+
+import argparse
+from array import array
+import os
+import random
+import struct
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from oth_board import OthBoard, BLACK, WHITE, PASS, PositionMaskBytes
+from oth_player_ab import OthelloPlayerAB
+from oth_pattern import PatternEvaluator, LoadWeights
+
+MAGIC = b'OTHPOS02'
+
+# magic, board size
+HEADER = struct.Struct('=8sH')
+
+def RecordType(size):
+    """
+    numpy dtype of a position record: the position as written by
+    OthBoard.ToBytes (size, player to move, black and white disc masks),
+    then the final disc differential for BLACK
+    """
+    n = PositionMaskBytes(size)
+    return np.dtype([('size', 'u1'), ('player', 'u1'),
+                     ('black', 'u1', (n,)), ('white', 'u1', (n,)), ('score', '<i2')])
+
+def PackRecord(position, score):
+    """
+    one position record as bytes, see RecordType
+    """
+    return position + struct.pack('<h', score)
+
+def PlayGame(size, seed, move_time, epsilon, weights):
+    """
+    play one self-play game, in a worker
+    moves are BestMove's, or random ones with probability epsilon
+    returns list of the positions (OthBoard.ToBytes) before every move,
+    and the final disc differential for BLACK
+    """
+    rng = random.Random(seed)
+    board = OthBoard(4)
+    board.ChangeSize(size)
+    player = OthelloPlayerAB(board)
+    player.SetTimeLimit(move_time)
+    if weights is not None and os.path.exists(weights):
+        player.LoadEvaluator(weights)
+
+    positions = []
+    while not board.Terminal():
+        moves = board.GetLegalMoves()
+        if not moves:
+            board.Play(PASS)
+            continue
+
+        positions.append(board.ToBytes())
+        if rng.random() < epsilon:
+            move = rng.choice(moves)
+        else:
+            move = player.BestMove()[1]
+        board.Play(move)
+
+    return positions, board.counts[BLACK] - board.counts[WHITE]
+
+def GenerateGames(size, games, data, workers, move_time, epsilon, weights, seed):
+    """
+    play games in worker processes, appending their positions to data
+    (an existing data file must hold positions of the same board size)
+    returns number of positions written
+    """
+    new_file = not os.path.exists(data)
+    if not new_file:
+        data_size = ReadHeader(data)
+        if data_size != size:
+            raise ValueError("{} holds {}x{} positions".format(data, data_size, data_size))
+    written = 0
+
+    with open(data, 'ab') as f:
+        if new_file:
+            f.write(HEADER.pack(MAGIC, size))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(PlayGame, size, seed + g, move_time, epsilon, weights)
+                       for g in range(games)]
+
+            for done, future in enumerate(as_completed(futures), 1):
+                positions, score = future.result()
+                f.write(b''.join(PackRecord(position, score) for position in positions))
+                written += len(positions)
+                print('game {}/{}: {} positions, black {:+d}'.format(
+                    done, games, len(positions), score))
+
+    return written
+
+def ReadHeader(data):
+    """
+    returns the board size of a data file
+    """
+    with open(data, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+        raise ValueError("{} is not a self-play position file".format(data))
+    _, size = HEADER.unpack(header)
+    return size
+
+def LoadPositions(data):
+    """
+    returns (size, records) of a data file, records are memory mapped
+    """
+    size = ReadHeader(data)
+    records = np.memmap(data, dtype=RecordType(size), mode='r', offset=HEADER.size)
+    return size, records
+
+def FeatureColumns(evaluator, records):
+    """
+    (N, instances) array of the weight (column) every pattern instance
+    of every record uses, with all weight tables laid out one after another
+    """
+    n = evaluator.size ** 2
+    black = np.unpackbits(records['black'], axis=1, bitorder='little')[:, :n]
+    white = np.unpackbits(records['white'], axis=1, bitorder='little')[:, :n]
+    # colors are the base 3 digits
+    digits = BLACK * black.astype(np.int64) + WHITE * white.astype(np.int64)
+
+    offsets = np.cumsum([0] + [len(w) for w in evaluator.weights])
+    columns = np.empty((len(records), len(evaluator.instances)), dtype=np.int64)
+    for i, (p, squares) in enumerate(evaluator.instances):
+        powers = 3 ** np.arange(len(squares), dtype=np.int64)
+        columns[:, i] = offsets[p] + digits[:, squares] @ powers
+    return columns
+
+def FitWeights(evaluator, records, epochs, batch_size, rate, seed):
+    """
+    fit evaluator's weights (and bias) to the records' final disc
+    differentials with batched gradient steps on the squared error
+    every weight's step is divided by how often it occurs in the batch,
+    so rare pattern configurations do not jump around
+    """
+    rng = np.random.default_rng(seed)
+    w = np.concatenate([np.frombuffer(t, dtype=np.float32) for t in evaluator.weights]).astype(np.float64)
+    bias = float(evaluator.bias)
+
+    for epoch in range(epochs):
+        order = rng.permutation(len(records))
+        total = 0.0
+
+        for start in range(0, len(order), batch_size):
+            batch = np.sort(order[start:start + batch_size])
+            columns = FeatureColumns(evaluator, records[batch])
+            target = records['score'][batch].astype(np.float64)
+
+            error = w[columns].sum(axis=1) + bias - target
+            total += float(error @ error)
+
+            gradient = np.zeros_like(w)
+            counts = np.zeros_like(w)
+            np.add.at(gradient, columns, error[:, None])
+            np.add.at(counts, columns, 1.0)
+            seen = counts > 0
+            w[seen] -= rate * gradient[seen] / counts[seen]
+            bias -= rate * error.mean()
+
+        print('epoch {}/{}: rms error {:.3f}'.format(epoch + 1, epochs, (total / len(order)) ** 0.5))
+
+    offsets = np.cumsum([0] + [len(t) for t in evaluator.weights])
+    for p in range(len(evaluator.weights)):
+        evaluator.weights[p] = array('f', w[offsets[p]:offsets[p + 1]].astype(np.float32).tobytes())
+    evaluator.bias = bias
+    return evaluator
+
+def main():
+    parser = argparse.ArgumentParser(description="train pattern evaluation weights from self-play")
+    parser.add_argument('size', type=int, help="board size")
+    parser.add_argument('games', type=int, help="self-play games to add to the data file")
+    parser.add_argument('--weights', help="weight file to improve and write (weights_<size>x<size>.bin)")
+    parser.add_argument('--data', help="position file to append to (games_<size>x<size>.bin)")
+    parser.add_argument('--workers', type=int, default=None, help="self-play processes")
+    parser.add_argument('--move-time', type=float, default=0.2, help="time limit given to BestMove")
+    parser.add_argument('--epsilon', type=float, default=0.1, help="chance of a random move")
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=4096)
+    parser.add_argument('--rate', type=float, default=0.05, help="gradient step size")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    weights = args.weights or 'weights_{0}x{0}.bin'.format(args.size)
+    data = args.data or 'games_{0}x{0}.bin'.format(args.size)
+
+    if args.games > 0:
+        written = GenerateGames(args.size, args.games, data, args.workers, args.move_time,
+                                args.epsilon, weights, args.seed)
+        print('{} positions written to {}'.format(written, data))
+
+    size, records = LoadPositions(data)
+    if size != args.size:
+        raise ValueError("{} holds {}x{} positions".format(data, size, size))
+
+    if os.path.exists(weights):
+        evaluator = LoadWeights(weights)
+    else:
+        evaluator = PatternEvaluator(size)
+
+    FitWeights(evaluator, records, args.epochs, args.batch_size, args.rate, args.seed)
+    evaluator.Save(weights)
+    print('weights written to {}'.format(weights))
+
+if "__main__" == __name__:
+    main()